@@ -0,0 +1,7 @@
+import sys
+
+from stark.processing.internal_saves import main
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -2,6 +2,7 @@ import sys
 import time
 from pathlib import Path
 import stark
+from stark.processing.readers import find_conllu_files
 from stark.stark import read_settings, parse_args
 import logging
 logger = logging.getLogger('stark')
@@ -15,7 +16,7 @@ def main():
     input_path = Path(settings['input_path'])
     output_path_parts = Path(settings['output']).parts
 
-    for path in sorted(input_path.rglob('*.conllu')):
+    for path in find_conllu_files(input_path):
         # create path to actual location
         relative_path_parts = path.parts[len(input_path.parts):]
         output_path = Path(*output_path_parts, *relative_path_parts)
@@ -12,22 +12,85 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from stark.data.processing.columnar import ColumnarSentence, FlatTrees
+
+
 class Document(object):
-    def __init__(self):
+    def __init__(self, vocabulary=None):
         self.trees = []
         self.sentence_statistics = []
-        self.form_dict = {}
-        self.lemma_dict = {}
-        self.upos_dict = {}
-        self.xpos_dict = {}
-        self.deprel_dict = {}
+        # memory mapped corpus, that contains sentences whose tokens are not stored in sentence_statistics
+        self.corpus = None
+        # corpus vocabulary that contains tokens of trees
+        self.vocabulary = vocabulary
+
+    @staticmethod
+    def _iterate_nodes(roots):
+        """
+        Yields all nodes of trees with given roots.
+        :param roots:
+        :return:
+        """
+        nodes = list(roots)
+        while nodes:
+            node = nodes.pop()
+            yield node
+            nodes.extend(node.children)
+
+    def get_token_ids(self):
+        """
+        Returns a set of vocabulary ids of all tokens in document.
+        :return:
+        """
+        token_ids = set()
+        for tree in self.trees:
+            if isinstance(tree, ColumnarSentence):
+                token_ids.update(tree.get_column('token'))
+            else:
+                token_ids.update(node.token_id for node in Document._iterate_nodes(tree))
+        return token_ids
+
+    def remap_tokens(self, token_mapping):
+        """
+        Replaces ids of tokens in all trees, when document is moved to another vocabulary.
+        :param token_mapping: A list or dictionary that maps old token ids to new ones.
+        :return:
+        """
+        for tree in self.trees:
+            if isinstance(tree, ColumnarSentence):
+                tree.remap_tokens(token_mapping)
+            else:
+                for node in Document._iterate_nodes(tree):
+                    node.token_id = token_mapping[node.token_id]
+
+    def get_sentence_tokens(self, sentence):
+        """
+        Returns a list of (form, space_after) pairs of a sentence.
+        :param sentence: Sentence statistics.
+        :return:
+        """
+        if 'tokens' in sentence:
+            return sentence['tokens']
+        return self.corpus.read_tokens(sentence['span'])
 
     def get_document_data(self):
-        return [self.trees, self.form_dict, self.lemma_dict, self.upos_dict, self.xpos_dict, self.deprel_dict,
-                self.sentence_statistics]
+        # vocabulary is shared by the whole corpus, so only tokens of this document are stored
+        trees = [tree if isinstance(tree, ColumnarSentence) else FlatTrees(tree) for tree in self.trees]
+        return [trees, self.sentence_statistics, self.corpus, self.vocabulary.get_token_values(self.get_token_ids())]
 
     @classmethod
-    def create_document_from_cache(cls, doc_data):
-        d = cls()
-        d.trees, d.form_dict, d.lemma_dict, d.upos_dict, d.xpos_dict, d.deprel_dict, d.sentence_statistics = doc_data
+    def create_document_from_cache(cls, doc_data, vocabulary):
+        """
+        Creates document from cache and adds its tokens to vocabulary.
+        :param doc_data:
+        :param vocabulary: Corpus vocabulary.
+        :return:
+        """
+        d = cls(vocabulary)
+        d.trees, d.sentence_statistics, d.corpus, token_values = doc_data
+        token_mapping = vocabulary.add_token_values(token_values)
+        if any(token_id != new_token_id for token_id, new_token_id in token_mapping.items()):
+            d.remap_tokens(token_mapping)
+        # trees that were linked before they were stored are linked again
+        d.trees = [tree.create_trees(vocabulary) if isinstance(tree, FlatTrees) else tree for tree in d.trees]
         return d
@@ -0,0 +1,55 @@
+# Copyright 2024 CJVT
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections.abc import Mapping
+
+
+class FeatureBundle(Mapping):
+    """
+    Immutable set of morphological features of a token, that maps features to their values. Each distinct bundle is
+    created only once per corpus (in Vocabulary) and shared by all tokens with the same features.
+    """
+    __slots__ = ('features', 'string')
+
+    def __init__(self, features):
+        """
+        :param features: A tuple of (feature, value) pairs.
+        """
+        self.features = dict(features)
+        # representation used in output (ie. 'Case=Nom|Number=Sing')
+        self.string = '|'.join(f'{feat}={value}' for feat, value in features)
+
+    def __reduce__(self):
+        return FeatureBundle, (tuple(self.features.items()),)
+
+    def __repr__(self):
+        return self.string
+
+    def __getitem__(self, feat):
+        return self.features[feat]
+
+    def __contains__(self, feat):
+        return feat in self.features
+
+    def __iter__(self):
+        return iter(self.features)
+
+    def __len__(self):
+        return len(self.features)
+
+    def get(self, feat, default=None):
+        return self.features.get(feat, default)
+
+    def items(self):
+        return self.features.items()
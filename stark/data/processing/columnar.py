@@ -0,0 +1,132 @@
+# Copyright 2024 CJVT
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+
+from stark.data.processing.tree import Tree
+
+
+class ColumnarSentence(object):
+    """
+    Compact representation of a sentence, that stores its tokens in a single array of integers (tokens are stored as
+    ids of a Vocabulary). Tree objects are only created when sentence is counted.
+    """
+    # order of columns in array of a sentence (each column holds one value per token)
+    COLUMNS = ['index', 'head', 'token']
+
+    def __init__(self, token_rows, heads, conll, tree_class, vocabulary):
+        """
+        :param token_rows: A list of (index, form, lemma, upos, xpos, deprel, feats_detailed) tuples.
+        :param heads: Indices of heads of tokens (0 for roots and -1 for tokens that are not connected).
+        :param conll: Sentence in CoNLL-U format (or a reference to it) or None.
+        :param tree_class: Class of nodes that are created (GreedyTree or QueryTree).
+        :param vocabulary: Vocabulary used for mapping tokens to ids.
+        """
+        self.size = len(token_rows)
+        self.conll = conll
+        self.tree_class = tree_class
+
+        self.columns = array('i', (row[0] for row in token_rows))
+        self.columns.extend(heads)
+        self.columns.extend(vocabulary.add_token(*row[1:]) for row in token_rows)
+
+    def get_column(self, name):
+        """
+        Returns values of a column.
+        :param name: Name of a column (one of COLUMNS).
+        :return:
+        """
+        column_i = self.COLUMNS.index(name)
+        return self.columns[column_i * self.size:(column_i + 1) * self.size]
+
+    def remap_tokens(self, token_mapping):
+        """
+        Replaces ids of tokens, when sentence is moved to another vocabulary.
+        :param token_mapping: A list or dictionary that maps old token ids to new ones.
+        :return:
+        """
+        token_start = self.COLUMNS.index('token') * self.size
+        self.columns[token_start:token_start + self.size] = array(
+            'i', (token_mapping[token_id] for token_id in self.get_column('token')))
+
+    def create_trees(self, vocabulary):
+        """
+        Creates tree nodes of a sentence and returns its roots.
+        :param vocabulary: Vocabulary that contains tokens of a sentence.
+        :return:
+        """
+        size = self.size
+        columns = self.columns
+        token_nodes = []
+        for i in range(size):
+            token_id = columns[2 * size + i]
+            form, lemma, upos, xpos, deprel, feats = vocabulary.get_token(token_id)
+            token_nodes.append(self.tree_class(columns[i], form, lemma, upos, xpos, deprel, columns[size + i], feats,
+                                               token_id))
+
+        return Tree.link_nodes(token_nodes, self.get_column('head'), self.conll)
+
+
+class FlatTrees(ColumnarSentence):
+    """
+    Flat representation of already linked trees of a sentence, used for storing them in cache. Nodes are stored in
+    depth-first order together with positions of their parents, so that trees are stored and recreated without
+    recursion and exactly as they were linked.
+    """
+    COLUMNS = ['index', 'parent', 'token', 'children_split']
+
+    def __init__(self, roots):
+        """
+        :param roots: Roots of trees of a sentence.
+        """
+        self.conll = roots[0].conll if roots else None
+        self.tree_class = type(roots[0]) if roots else None
+
+        rows = []
+        # pairs of nodes and positions of their parents (0 for roots)
+        nodes = [(root, 0) for root in reversed(roots)]
+        while nodes:
+            node, parent = nodes.pop()
+            rows.append((node.index, parent, node.token_id, node.children_split))
+            nodes.extend((child, len(rows)) for child in reversed(node.children))
+
+        self.size = len(rows)
+        self.columns = array('i', (row[column_i] for column_i in range(len(self.COLUMNS)) for row in rows))
+
+    def create_trees(self, vocabulary):
+        """
+        Recreates tree nodes of a sentence and returns its roots.
+        :param vocabulary: Vocabulary that contains tokens of a sentence.
+        :return:
+        """
+        size = self.size
+        columns = self.columns
+        token_nodes = []
+        roots = []
+        for i in range(size):
+            token_id = columns[2 * size + i]
+            form, lemma, upos, xpos, deprel, feats = vocabulary.get_token(token_id)
+            token = self.tree_class(columns[i], form, lemma, upos, xpos, deprel, None, feats, token_id)
+            token.children_split = columns[3 * size + i]
+            parent = columns[size + i]
+            if parent == 0:
+                if self.conll is not None:
+                    token.add_conll_sentence(self.conll)
+                roots.append(token)
+            else:
+                token_nodes[parent - 1].add_child(token)
+                token.set_parent(token_nodes[parent - 1])
+            token_nodes.append(token)
+
+        return roots
@@ -19,8 +19,10 @@ from stark.processing.filters import Filter
 
 
 class GreedyTree(Tree):
-    def __init__(self, index, form, lemma, upos, xpos, deprel, head, feats_detailed, document, summary):
-        super().__init__(index, form, lemma, upos, xpos, deprel, head, feats_detailed, document, summary)
+    __slots__ = ()
+
+    def __init__(self, index, form, lemma, upos, xpos, deprel, head, feats, token_id):
+        super().__init__(index, form, lemma, upos, xpos, deprel, head, feats, token_id)
 
     @staticmethod
     def _processing_filter(combinations, child_active_tree, filters):
@@ -37,13 +39,14 @@ class GreedyTree(Tree):
                 Filter.check_label_whitelist(child_active_tree.node.node.deprel, filters))
 
     @staticmethod
-    def _merge_incomplete_combinations(combinations, child_active_trees, filters):
+    def _merge_incomplete_combinations(combinations, child_active_trees, filters, node=None):
         """
         Creates all possible combinations of children trees when complete_tree_type=no. It utilizes loose processing
         filters.
         :param combinations: A list of all combinations of a tree node.
         :param child_active_trees: A list of trees that contain child node.
         :param filters:
+        :param node: Representation node of a tree node, which is used for dropping infrequent combinations while mining.
         :return:
         """
         # create all viable children combinations
@@ -52,8 +55,13 @@ class GreedyTree(Tree):
         for child_active_tree in child_active_trees:
             for combination in combinations:
                 if GreedyTree._processing_filter(combination, child_active_tree, filters):
-                    new_active_trees.append((combination[0] + child_active_tree.tree_size,
-                                             combination[1] + [child_active_tree]))
+                    new_combination = (combination[0] + child_active_tree.tree_size,
+                                       combination[1] + [child_active_tree])
+                    # trees that contain an infrequent tree are not frequent either, so it is not extended
+                    if filters['mining'] is not None and \
+                            not GreedyRepresentationTree(node, new_combination, filters).is_frequent(filters):
+                        continue
+                    new_active_trees.append(new_combination)
 
         combinations.extend(new_active_trees)
         return combinations
@@ -75,42 +83,52 @@ class GreedyTree(Tree):
         return combinations
 
     @staticmethod
-    def _merge_combinations(combinations, child_active_trees, filters):
+    def _merge_combinations(combinations, child_active_trees, filters, node=None):
         """
         Creates all possible combinations of children trees.
         :param combinations: A list of all combinations of a tree node.
         :param child_active_trees: A list of trees that contain child node.
         :param filters:
+        :param node: Representation node of a tree node.
         :return:
         """
         if filters['complete_tree_type']:
             combinations = GreedyTree._merge_complete_combinations(combinations, child_active_trees, filters)
         else:
-            combinations = GreedyTree._merge_incomplete_combinations(combinations, child_active_trees, filters)
+            combinations = GreedyTree._merge_incomplete_combinations(combinations, child_active_trees, filters, node)
 
         return combinations
 
-    def get_subtrees(self, filters):
+    def get_subtrees(self, filters, unigrams=None, active_trees=None):
         """
-        A recursion that builds representation trees (representation_tree) and stores and collect them (trees).
+        A recursion that builds representation trees (representation_tree) and yields them one at a time, so that
+        trees of a whole sentence are never stored together. Only trees that contain current node (active trees) are
+        kept, until they are combined into trees of parent node.
         :param filters:
+        :param unigrams: Dictionary of unigram frequencies, that is updated with tokens of visited nodes (None when
+        unigrams are not needed).
+        :param active_trees: A list to which trees that contain current node are added (None when they are not needed).
         :return:
         """
-        # a list that stores all trees
-        trees = []
+        if unigrams is not None:
+            unigrams[self.token_id] = unigrams.get(self.token_id, 0) + 1
         # A tuple containing cumulative size of all children, coupled with a list of children combinations.
         # The list contains combinations that are connected to the current node (and are relevant for further
         # generation). Set to [[]] because you always want an empty tree containing only itself.
         combinations = [(1, [])]
 
         node = RepresentationNode(self, self.index, filters['create_output_string_functs'])
+        # while mining, trees are extended only from frequent trees (starting with a frequent node)
+        if filters['mining'] is not None and not GreedyRepresentationTree(node, combinations[0], filters).is_frequent(
+                filters):
+            combinations = []
         for child in self.children:
-            child_active_trees, child_trees = child.get_subtrees(filters)
-            combinations = GreedyTree._merge_combinations(combinations, child_active_trees, filters)
-            trees.extend(child_trees)
+            child_active_trees = []
+            yield from child.get_subtrees(filters, unigrams, child_active_trees)
+            combinations = GreedyTree._merge_combinations(combinations, child_active_trees, filters, node)
 
-        active_trees = []
         for combination in combinations:
-            active_trees.append(GreedyRepresentationTree(node, combination, filters))
-        trees.extend(active_trees)
-        return active_trees, trees
+            active_tree = GreedyRepresentationTree(node, combination, filters)
+            if active_trees is not None:
+                active_trees.append(active_tree)
+            yield active_tree
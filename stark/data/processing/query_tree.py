@@ -21,16 +21,22 @@ from stark.processing.filters import Filter
 
 
 class QueryTree(Tree):
-    def __init__(self, index, form, lemma, upos, xpos, deprel, head, feats_detailed, document, summary):
-        super().__init__(index, form, lemma, upos, xpos, deprel, head, feats_detailed, document, summary)
+    __slots__ = ()
 
-    def get_subtrees(self, permanent_query_trees, temporary_query_trees, filters):
+    def __init__(self, index, form, lemma, upos, xpos, deprel, head, feats, token_id):
+        super().__init__(index, form, lemma, upos, xpos, deprel, head, feats, token_id)
+
+    def get_subtrees(self, permanent_query_trees, temporary_query_trees, filters, unigrams=None):
         """
 
         :param filters:
         :param permanent_query_trees:
         :param temporary_query_trees:
+        :param unigrams: Dictionary of unigram frequencies, that is updated with tokens of visited nodes (None when
+        unigrams are not needed).
         """
+        if unigrams is not None:
+            unigrams[self.token_id] = unigrams.get(self.token_id, 0) + 1
 
         # list of all children queries grouped by parent queries
         all_query_indices = []
@@ -58,7 +64,7 @@ class QueryTree(Tree):
                                                                          len(permanent_query_trees),
                                                                          permanent_query_trees,
                                                                          all_query_indices, self.children,
-                                                                         filters)
+                                                                         filters, unigrams)
 
         merged_partial_answers = []
         i_question = 0
@@ -92,8 +98,7 @@ class QueryTree(Tree):
             return True
 
         for feat in query_tree['feats_detailed'].keys():
-            if (feat not in self.feats_detailed or
-                    query_tree['feats_detailed'][feat] != next(iter(self.feats_detailed[feat].values()))):
+            if feat not in self.feats or query_tree['feats_detailed'][feat] != self.feats[feat]:
                 return False
 
         return True
@@ -135,7 +140,7 @@ class QueryTree(Tree):
 
     @staticmethod
     def _get_all_query_indices(temporary_query_nb, permanent_query_nb, permanent_query_trees, all_query_indices,
-                               children, filters):
+                               children, filters, unigrams=None):
         partial_answers = [[] for _ in range(permanent_query_nb + temporary_query_nb)]
         complete_answers = [[] for _ in range(permanent_query_nb)]
 
@@ -164,7 +169,7 @@ class QueryTree(Tree):
             # obtain children results
             new_partial_answers_dedup, new_complete_answers = child.get_subtrees(permanent_query_trees,
                                                                                  child_queries_flatten_dedup,
-                                                                                 filters)
+                                                                                 filters, unigrams)
 
             assert len(new_partial_answers_dedup) == len(child_queries_flatten_dedup)
 
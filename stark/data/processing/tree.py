@@ -16,39 +16,17 @@ from stark.utils import create_output_string_lemma
 
 
 class Tree(object):
-    def __init__(self, index, form, lemma, upos, xpos, deprel, head, feats_detailed, document, summary):
-
-        feats_dict = summary.feats_dict
-
-        if not hasattr(self, 'feats'):
-            self.feats_detailed = {}
-
-        if form not in document.form_dict:
-            document.form_dict[form] = form
-        self.form = document.form_dict[form]
-        if lemma not in document.lemma_dict:
-            document.lemma_dict[lemma] = lemma
-        self.lemma = document.lemma_dict[lemma]
-        if upos not in document.upos_dict:
-            document.upos_dict[upos] = upos
-        self.upos = document.upos_dict[upos]
-        if xpos not in document.xpos_dict:
-            document.xpos_dict[xpos] = xpos
-        self.xpos = document.xpos_dict[xpos]
-        if deprel not in document.deprel_dict:
-            document.deprel_dict[deprel] = deprel
-        self.deprel = document.deprel_dict[deprel]
-        for feat in feats_detailed.keys():
-            if feat not in feats_dict:
-                feats_dict[feat] = {}
-            if next(iter(feats_detailed[feat])) not in feats_dict[feat]:
-                feats_dict[feat][next(iter(feats_detailed[feat]))] = next(iter(feats_detailed[feat]))
-            if feat not in self.feats_detailed:
-                self.feats_detailed[feat] = {}
-            self.feats_detailed[feat][next(iter(feats_detailed[feat]))] = (
-                feats_dict)[feat][next(iter(feats_detailed[feat]))]
-
-        self.feats = {k: list(v.keys())[0] for k, v in self.feats_detailed.items()}
+    __slots__ = ('form', 'lemma', 'upos', 'xpos', 'deprel', 'feats', 'parent', 'children',
+                 'children_split', 'conll', 'index', 'token_id', '_name')
+
+    def __init__(self, index, form, lemma, upos, xpos, deprel, head, feats, token_id):
+        self.form = form
+        self.lemma = lemma
+        self.upos = upos
+        self.xpos = xpos
+        self.deprel = deprel
+        # FeatureBundle shared by all tokens with the same feats
+        self.feats = feats
 
         self.parent = head
         self.children = []
@@ -56,9 +34,42 @@ class Tree(object):
         self.conll = None
 
         self.index = index
+        # id of token attributes in corpus vocabulary
+        self.token_id = token_id
+        # name of node together with configuration (create_output_string functions) it was created for
+        self._name = None
 
-        # for caching answers to questions
-        self.cache = {}
+    @staticmethod
+    def link_nodes(token_nodes, heads, conll):
+        """
+        Connects nodes of a sentence into trees and returns their roots.
+        :param token_nodes: A list of sentence nodes.
+        :param heads: Indices of heads of nodes (0 for roots and -1 for nodes that should not be connected).
+        :param conll: Sentence in CoNLL-U format (or a reference to it) that is added to roots, when it is not None.
+        :return:
+        """
+        roots = []
+        for token_i, (token, head) in enumerate(zip(token_nodes, heads)):
+            if head == -1:
+                continue
+            if head == 0:
+                token.set_parent(None)
+                # add a conllu string if necessary
+                if conll is not None:
+                    token.add_conll_sentence(conll)
+                roots.append(token)
+            else:
+                parent_id = head - 1
+                if token_nodes[parent_id].children_split == -1 and token_i > parent_id:
+                    token_nodes[parent_id].children_split = len(token_nodes[parent_id].children)
+                token_nodes[parent_id].add_child(token)
+                token.set_parent(token_nodes[parent_id])
+
+        for token in token_nodes:
+            if token.children_split == -1:
+                token.children_split = len(token.children)
+
+        return roots
 
     def add_child(self, child):
         self.children.append(child)
@@ -66,11 +77,16 @@ class Tree(object):
     def set_parent(self, parent):
         self.parent = parent
 
-    def get_unigrams(self, create_output_strings):
-        unigrams = [Tree._generate_key(self, create_output_strings, print_lemma=False)[1]]
-        for child in self.children:
-            unigrams += child.get_unigrams(create_output_strings)
-        return unigrams
+    def get_name(self, create_output_strings):
+        """
+        Returns name parts and name of a node. They are created only once per configuration.
+        :param create_output_strings: Functions that create parts of node names.
+        :return:
+        """
+        if self._name is None or self._name[0] is not create_output_strings:
+            array, name = Tree._generate_key(self, create_output_strings)
+            self._name = (create_output_strings, array[0], name)
+        return self._name[1], self._name[2]
 
     def add_conll_sentence(self, conll):
         self.conll = conll
@@ -14,16 +14,17 @@
 import string
 import sys
 
-import networkx as nx
-from networkx.algorithms.bipartite import hopcroft_karp_matching
-
 from stark.data.representation.tree import RepresentationTree
 from stark.processing.filters import Filter
 
 
 class GreedyRepresentationTree(RepresentationTree):
+    __slots__ = ('tree_size', '_query_matches')
+
     def __init__(self, node, children, filters):
         self.tree_size = children[0]
+        # results of check_query by ids of queries (the same child tree is checked for all trees that contain it)
+        self._query_matches = None
         if filters['node_order']:
             children_sorted = children[1]
         else:
@@ -42,7 +43,34 @@ class GreedyRepresentationTree(RepresentationTree):
         tree_size = sum([child.tree_size for child in children]) + 1
         return cls(node, [tree_size, children], filters)
 
+    def is_frequent(self, filters):
+        """
+        Checks whether tree may be extended while mining, ie. it is frequent or its support is being counted.
+        :param filters:
+        :return:
+        """
+        frequent_keys, size = filters['mining']
+        return self.tree_size == size or self.get_summary_key(filters) in frequent_keys
+
     def check_query(self, query, filters):
+        """
+        Checks whether tree matches query, ie. its root matches root of query and its children can be paired with
+        children of query, so that each child matches its query child. Results are stored, because the same children
+        are checked for many trees.
+        :param query:
+        :param filters:
+        :return:
+        """
+        if self._query_matches is None:
+            self._query_matches = {}
+        # query trees exist during the whole processing, so their ids are unique
+        match = self._query_matches.get(id(query))
+        if match is None:
+            match = self._check_query(query, filters)
+            self._query_matches[id(query)] = match
+        return match
+
+    def _check_query(self, query, filters):
         # compares query and children lengths
         query_length = len(query['children']) if 'children' in query else 0
         if query_length != len(self.children):
@@ -59,23 +87,51 @@ class GreedyRepresentationTree(RepresentationTree):
             return True
 
         # compares children with query nodes
-        # creates nodes for graph children nodes go from 1 on and query children go from -1 back.
-        children_nodes = list(range(1, query_length+1))
-        query_children_nodes = list(range(-query_length, 0))
-        edges = []
-        for i, child in enumerate(self.children):
-            for j, query_child in enumerate(query['children']):
-                if child.check_query(query_child, filters):
-                    edges.append((i + 1, -j - 1))
-
-        graph = nx.Graph()
-        graph.add_nodes_from(children_nodes, bipartite=1)
-        graph.add_nodes_from(query_children_nodes, bipartite=0)
-        graph.add_edges_from(edges)
-
-        # hopcroft-karp algorithm efficiently finds number of connections between
-        connections = hopcroft_karp_matching(graph, children_nodes)
-        return len(connections) == query_length * 2
+        matches = []
+        for child in self.children:
+            child_matches = [child.check_query(query_child, filters) for query_child in query['children']]
+            # a child that matches no query child can not be paired
+            if not any(child_matches):
+                return False
+            matches.append(child_matches)
+
+        return GreedyRepresentationTree._has_perfect_matching(matches)
+
+    @staticmethod
+    def _has_perfect_matching(matches):
+        """
+        Checks whether children can be paired with query children (a perfect matching in bipartite graph), using
+        augmenting paths. Graphs are small, so cases with up to three children are compared directly.
+        :param matches: A square matrix, where matches[i][j] is True when child i matches query child j.
+        :return:
+        """
+        n = len(matches)
+        if n == 1:
+            return matches[0][0]
+        if n == 2:
+            return (matches[0][0] and matches[1][1]) or (matches[0][1] and matches[1][0])
+        if n == 3:
+            m0, m1, m2 = matches
+            return ((m0[0] and ((m1[1] and m2[2]) or (m1[2] and m2[1]))) or
+                    (m0[1] and ((m1[0] and m2[2]) or (m1[2] and m2[0]))) or
+                    (m0[2] and ((m1[0] and m2[1]) or (m1[1] and m2[0]))))
+
+        # query_children[j] is index of child paired with query child j
+        query_children = [-1] * n
+
+        def augment(i, visited):
+            for j in range(n):
+                if matches[i][j] and not visited[j]:
+                    visited[j] = True
+                    if query_children[j] == -1 or augment(query_children[j], visited):
+                        query_children[j] = i
+                        return True
+            return False
+
+        for i in range(n):
+            if not augment(i, [False] * n):
+                return False
+        return True
 
     def pass_filter(self, query_trees, filters):
         """
@@ -16,14 +16,14 @@ from stark.utils import create_output_string_lemma
 
 
 class RepresentationNode(object):
+    __slots__ = ('name_parts', 'name', 'location', 'node', 'feats')
+
     def __init__(self, node, architecture_order, create_output_strings):
-        self.name_parts, self.name = self.generate_name(node, create_output_strings)
+        # names are stored in processing node, so they are shared by all representations of a node
+        self.name_parts, self.name = node.get_name(create_output_strings)
         self.location = architecture_order
         self.node = node
-        for k, v in node.feats_detailed.items():
-            assert len(v.keys()) == 1
-
-        self.feats = {k: list(v.keys())[0] for k, v in node.feats_detailed.items()}
+        self.feats = node.feats
 
     def __repr__(self):
         return self.name
@@ -16,6 +16,8 @@ from stark.data.representation.tree import RepresentationTree
 
 
 class QueryRepresentationTree(RepresentationTree):
+    __slots__ = ()
+
     def __init__(self, node, children, filters):
         super().__init__(node, children)
 
@@ -0,0 +1,84 @@
+# Copyright 2024 CJVT
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class SubtreeKeys(object):
+    """
+    A table of canonical subtree codes. Each distinct code (node name together with codes of its children) gets an
+    integer id, so that equal subtrees get equal ids regardless of sentences they come from. Keys and word arrays of
+    subtrees are rendered only once per id. Ids are valid only inside a single process, so results are still stored by
+    rendered keys.
+    """
+    __slots__ = ('_ids', '_rendered', '_summary_keys')
+
+    def __init__(self):
+        self._ids = {}
+        # rendered (key, word_array) pairs of ids
+        self._rendered = []
+        # keys of summary (with letters of node order), keys and word arrays of pairs of ids and ranks of node order
+        self._summary_keys = {}
+
+    def __reduce__(self):
+        # ids are local to process, so workers always start with an empty table
+        return SubtreeKeys, ()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get_id(self, name, children):
+        """
+        Returns id of subtree code.
+        :param name: Name of root node.
+        :param children: A tuple of codes of children (their ids, dependency relations and sides).
+        :return:
+        """
+        code = (name, children)
+        key_id = self._ids.get(code)
+        if key_id is None:
+            key_id = len(self._rendered)
+            self._ids[code] = key_id
+            self._rendered.append(None)
+        return key_id
+
+    def get_key_array(self, key_id, tree, filters):
+        """
+        Returns key and word array of a subtree with given id. They are rendered from the first tree with this id.
+        :param key_id:
+        :param tree: Representation tree with given id.
+        :param filters:
+        :return:
+        """
+        rendered = self._rendered[key_id]
+        if rendered is None:
+            rendered = tree.get_key_array(filters)
+            self._rendered[key_id] = rendered
+        return rendered
+
+    def get_summary_key(self, key_id, order_ranks, tree, filters):
+        """
+        Returns key under which subtree is counted in summary, key without letters of node order and word array. They
+        are rendered only once per id and order of nodes, so that counting an occurrence does not build strings.
+        :param key_id:
+        :param order_ranks: Ranks of nodes (returned by get_order_ranks of tree) or None, when node_order is off.
+        :param tree: Representation tree with given id and order of nodes.
+        :param filters:
+        :return:
+        """
+        summary_key = self._summary_keys.get((key_id, order_ranks))
+        if summary_key is None:
+            key, word_array = self.get_key_array(key_id, tree, filters)
+            summary_key = (key + tree.get_ranks_letters(order_ranks) if order_ranks is not None else key, key,
+                           word_array)
+            self._summary_keys[(key_id, order_ranks)] = summary_key
+        return summary_key
@@ -16,9 +16,16 @@ import string
 
 
 class RepresentationTree(object):
+    __slots__ = ('node', 'children', '_key_id', '_key_array', '_order')
+
     def __init__(self, node, children):
         self.node = node
         self.children = children
+        # id of canonical code, key with array and order of tree are computed only once and then composed from values
+        # of children (the same child trees are shared by many parent trees)
+        self._key_id = None
+        self._key_array = None
+        self._order = None
 
     @classmethod
     @abc.abstractmethod
@@ -27,6 +34,9 @@ class RepresentationTree(object):
 
     def set_children(self, children):
         self.children = children
+        self._key_id = None
+        self._key_array = None
+        self._order = None
 
     def get_grew(self):
         nodes = [self.node]
@@ -51,15 +61,48 @@ class RepresentationTree(object):
         for child in children:
             new_children.append(child.ignore_nodes(filters))
 
+        # trees without ignored nodes are kept, so that their canonical codes are not computed again
+        if len(children) == len(self.children) and all(new_child is child for new_child, child in
+                                                       zip(new_children, children)):
+            return self
         return self.copy(self.node, new_children, filters)
 
+    def get_key_id(self, filters):
+        """
+        Returns id of canonical code of a tree. Code of a node consists of its name and codes of its children.
+        Children are already in canonical order (sorted by their keys, when node_order is off), so codes of equal trees
+        are equal.
+        :param filters:
+        :return:
+        """
+        if self._key_id is None:
+            children = []
+            for child in self.children:
+                children.append((child.get_key_id(filters),
+                                 child.node.node.deprel if filters['dependency_type'] else None,
+                                 filters['node_order'] and child.node.location < self.node.location))
+            self._key_id = filters['subtree_keys'].get_id(self.node.name, tuple(children))
+        return self._key_id
+
+    def get_summary_key(self, filters):
+        """
+        Returns key under which tree is counted in summary (with letters of node order, when node_order is on).
+        :param filters:
+        :return:
+        """
+        order_ranks = self.get_order_ranks(self.get_order(filters)) if filters['node_order'] else None
+        return filters['subtree_keys'].get_summary_key(self.get_key_id(filters), order_ranks, self, filters)[0]
+
     def get_key_array(self, filters):
         """
-        A code that generates key and array of a tree simultaneously (for faster execution).
+        A code that generates key and array of a tree simultaneously (for faster execution). They are stored and
+        composed from stored keys and arrays of children.
         :return:
         key: Key of a tree
         array: Array of tree elements
         """
+        if self._key_array is not None:
+            return self._key_array
 
         array = []
         key = ''
@@ -92,12 +135,12 @@ class RepresentationTree(object):
             if not write_self_node_to_result:
                 key += self.node.name
                 array += [self.node.name_parts]
-            array = array
             key = '(' + key + ')'
         else:
             array = [self.node.name_parts]
             key = self.node.name
-        return key, array
+        self._key_array = (key, array)
+        return self._key_array
 
     def get_key(self, filters):
         """
@@ -105,33 +148,7 @@ class RepresentationTree(object):
         :return:
         key: Key of a tree
         """
-        key = ''
-        write_self_node_to_result = False
-        if self.children:
-            children = self.children
-            for child in children:
-                if filters['node_order'] and child.node.location < self.node.location:
-                    if filters['dependency_type']:
-                        separator = ' <' + child.node.node.deprel + ' '
-                    else:
-                        separator = ' < '
-                    key += child.get_key(filters) + separator
-                else:
-                    if not write_self_node_to_result:
-                        write_self_node_to_result = True
-                        key += self.node.name
-                    if filters['dependency_type']:
-                        separator = ' >' + child.node.node.deprel + ' '
-                    else:
-                        separator = ' > '
-                    key += separator + child.get_key(filters)
-
-            if not write_self_node_to_result:
-                key += self.node.name
-            key = '(' + key + ')'
-        else:
-            key = self.node.name
-        return key
+        return self.get_key_array(filters)[0]
 
     def get_key_sorted(self, filters):
         key = ''
@@ -183,6 +200,15 @@ class RepresentationTree(object):
         return order_key
 
     def get_order(self, filters):
+        """
+        Returns locations of nodes in order of key. They are stored and composed from stored orders of children, so the
+        returned list should not be changed.
+        :param filters:
+        :return:
+        """
+        if self._order is not None:
+            return self._order
+
         order = []
         write_self_node_to_result = False
         if self.children:
@@ -192,14 +218,14 @@ class RepresentationTree(object):
                 else:
                     if not write_self_node_to_result:
                         write_self_node_to_result = True
-                        order += [self.node.location]
+                        order.append(self.node.location)
                     order += child.get_order(filters)
 
             if not write_self_node_to_result:
-                order += [self.node.location]
-            order = order
+                order.append(self.node.location)
         else:
             order = [self.node.location]
+        self._order = order
         return order
 
     def get_array(self, filters):
@@ -223,14 +249,36 @@ class RepresentationTree(object):
         return array
 
     @staticmethod
-    def get_order_letters(order):
-        order_letters = [''] * len(order)
-        for i in range(len(order)):
-            ind = order.index(min(order))
-            order[ind] = 10000
+    def get_order_ranks(order):
+        """
+        Returns positions of nodes in key, sorted by their locations in sentence. Trees with equal ranks get equal
+        letters of node order.
+        :param order: Locations of nodes (it is not changed).
+        :return:
+        """
+        return tuple(sorted(range(len(order)), key=order.__getitem__))
+
+    @staticmethod
+    def get_ranks_letters(order_ranks):
+        """
+        Returns letters that mark relative order of nodes (A for the first node in sentence, B for the second...).
+        :param order_ranks: Ranks of nodes returned by get_order_ranks.
+        :return:
+        """
+        order_letters = [''] * len(order_ranks)
+        for i, ind in enumerate(order_ranks):
             order_letters[ind] = string.ascii_uppercase[i % 26]
         return ''.join(order_letters)
 
+    @staticmethod
+    def get_order_letters(order):
+        """
+        Returns letters that mark relative order of nodes (A for the first node in sentence, B for the second...).
+        :param order: Locations of nodes (it is not changed).
+        :return:
+        """
+        return RepresentationTree.get_ranks_letters(RepresentationTree.get_order_ranks(order))
+
     def ignore_labels(self, filters):
         if filters['ignored_labels']:
             return self.ignore_nodes(filters)
@@ -246,20 +294,4 @@ class RepresentationTree(object):
         return mapper
 
     def get_array_location(self, filters):
-        array = []
-        write_self_node_to_result = False
-        if self.children:
-            for child in self.children:
-                if filters['node_order'] and child.node.location < self.node.location:
-                    array += child.get_array_location(filters)
-                else:
-                    if not write_self_node_to_result:
-                        write_self_node_to_result = True
-                        array += [self.node.location]
-                    array += child.get_array_location(filters)
-
-            if not write_self_node_to_result:
-                array += [self.node.location]
-        else:
-            array = [self.node.location]
-        return array
+        return self.get_order(filters)
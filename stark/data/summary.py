@@ -12,13 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from stark.data.vocabulary import Vocabulary
+
 
 class Summary(object):
     """
     A class that is used to store results of processing.
     """
     def __init__(self):
-        self.feats_dict = {}
+        # maps values of token attributes of the whole corpus to ids
+        self.vocabulary = Vocabulary()
         self.query_trees = None
         self.samples = []
         self.corpus_size = 0
@@ -39,9 +42,53 @@ class Summary(object):
         A function that returns summary data used for storing cache.
         :return:
         """
-        return (self.representation_trees, self.unigrams, self.corpus_size, self.feats_dict,
+        return (self.representation_trees, self.unigrams, self.corpus_size, self.vocabulary,
                 self.samples, self.max_tree_size, self.query_trees)
 
+    def get_journal_data(self):
+        """
+        A function that returns summary data used for storing results of a single file in journal. Instead of whole
+        vocabulary, only tokens of unigrams are stored.
+        :return:
+        """
+        return (self.representation_trees, self.unigrams, self.vocabulary.get_token_values(self.unigrams.keys()),
+                self.corpus_size, self.samples, self.max_tree_size)
+
+    def merge(self, other, filters):
+        """
+        Adds results of other summary (ie. results of a later part of a corpus) to this one. The result is the same as if
+        both parts were processed by a single summary.
+        :param other: Summary with results of a later part of a corpus.
+        :param filters:
+        :return:
+        """
+        for key, other_tree in other.representation_trees.items():
+            if key not in self.representation_trees:
+                self.representation_trees[key] = other_tree
+                continue
+
+            tree = self.representation_trees[key]
+            tree['number'] += other_tree['number']
+            if filters['detailed_results_file']:
+                tree['sentence'].extend(other_tree['sentence'])
+            elif filters['example'] and tree['sentence'][0][3] >= 15 and \
+                    tree['sentence'][0][3] > other_tree['sentence'][0][3]:
+                tree['sentence'] = other_tree['sentence']
+
+        # unigrams are ids of tokens in vocabulary of other summary
+        token_mapping = self.vocabulary.update(other.vocabulary) if other.vocabulary is not self.vocabulary else None
+        for unigram, number in other.unigrams.items():
+            if token_mapping is not None:
+                unigram = token_mapping[unigram]
+            if unigram in self.unigrams:
+                self.unigrams[unigram] += number
+            else:
+                self.unigrams[unigram] = number
+
+        self.corpus_size += other.corpus_size
+        self.samples.extend(other.samples)
+        self.max_tree_size = max(self.max_tree_size, other.max_tree_size)
+
     @classmethod
     def create_summary_from_cache(cls, sum_data):
         """
@@ -50,10 +97,25 @@ class Summary(object):
         :return:
         """
         s = cls()
-        s.representation_trees, s.unigrams, s.corpus_size, s.feats_dict, s.samples, s.max_tree_size, s.query_trees = (
+        s.representation_trees, s.unigrams, s.corpus_size, s.vocabulary, s.samples, s.max_tree_size, s.query_trees = (
             sum_data)
         return s
 
+    @classmethod
+    def create_summary_from_journal(cls, journal_data, vocabulary):
+        """
+        A function that forms summary from journal data.
+        :param journal_data:
+        :param vocabulary: Vocabulary to which tokens of unigrams are added.
+        :return:
+        """
+        s = cls()
+        s.vocabulary = vocabulary
+        s.representation_trees, unigrams, token_values, s.corpus_size, s.samples, s.max_tree_size = journal_data
+        token_mapping = vocabulary.add_token_values(token_values)
+        s.unigrams = {token_mapping[unigram]: number for unigram, number in unigrams.items()}
+        return s
+
     # def get_size_representation_trees(self):
     #     size = 0
     #     for represetation_tree_k, represetation_tree_v in self.representation_trees.items():
@@ -0,0 +1,122 @@
+# Copyright 2024 CJVT
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from stark.data.feature_bundle import FeatureBundle
+
+TOKEN_ATTRIBUTES = ['form', 'lemma', 'upos', 'xpos', 'deprel', 'feats']
+# tokens are stored as tuples of ids of their attributes
+VOCABULARY_ATTRIBUTES = TOKEN_ATTRIBUTES + ['token']
+
+
+class Vocabulary(object):
+    """
+    A class that maps values of token attributes (and whole tokens) to small integers and back. A single vocabulary is
+    shared by all documents of a corpus.
+    """
+    def __init__(self):
+        self.ids = {attribute: {} for attribute in VOCABULARY_ATTRIBUTES}
+        self.values = {attribute: [] for attribute in VOCABULARY_ATTRIBUTES}
+        # feats in the form used by trees, shared by all tokens with the same feats
+        self.feature_bundles = []
+
+    def __getstate__(self):
+        # ids are recreated from values, so they are not stored
+        return {'values': self.values}
+
+    def __setstate__(self, state):
+        self.__init__()
+        for attribute in VOCABULARY_ATTRIBUTES:
+            for value in state['values'][attribute]:
+                self.get_id(attribute, value)
+
+    def get_id(self, attribute, value):
+        """
+        Returns id of a value and adds value to vocabulary when it is not there yet.
+        :param attribute: Name of token attribute (ie. 'form').
+        :param value:
+        :return:
+        """
+        attribute_ids = self.ids[attribute]
+        if value not in attribute_ids:
+            attribute_ids[value] = len(self.values[attribute])
+            self.values[attribute].append(value)
+            if attribute == 'feats':
+                self.feature_bundles.append(FeatureBundle(value))
+        return attribute_ids[value]
+
+    def get_value(self, attribute, value_id):
+        """
+        Returns value with a given id.
+        :param attribute: Name of token attribute (ie. 'form').
+        :param value_id:
+        :return:
+        """
+        return self.values[attribute][value_id]
+
+    def add_token(self, form, lemma, upos, xpos, deprel, feats_detailed):
+        """
+        Adds attributes of a token to vocabulary and returns id of a token. Only the first value of each feat is kept.
+        :param form:
+        :param lemma:
+        :param upos:
+        :param xpos:
+        :param deprel:
+        :param feats_detailed: A dictionary of feats and their sets of values.
+        :return:
+        """
+        feats = tuple((feat, next(iter(values))) for feat, values in feats_detailed.items())
+        return self.get_id('token', (self.get_id('form', form), self.get_id('lemma', lemma),
+                                     self.get_id('upos', upos), self.get_id('xpos', xpos),
+                                     self.get_id('deprel', deprel), self.get_id('feats', feats)))
+
+    def get_token(self, token_id):
+        """
+        Returns (form, lemma, upos, xpos, deprel, feats) of a token, where feats are a FeatureBundle. Returned values
+        are shared by all tokens that contain them.
+        :param token_id:
+        :return:
+        """
+        form_id, lemma_id, upos_id, xpos_id, deprel_id, feats_id = self.values['token'][token_id]
+        return (self.values['form'][form_id], self.values['lemma'][lemma_id], self.values['upos'][upos_id],
+                self.values['xpos'][xpos_id], self.values['deprel'][deprel_id], self.feature_bundles[feats_id])
+
+    def get_token_values(self, token_ids):
+        """
+        Returns attribute values of tokens, so that they can be stored independently of this vocabulary.
+        :param token_ids:
+        :return: A dictionary that maps token ids to tuples of their attribute values.
+        """
+        return {token_id: tuple(self.values[attribute][value_id] for attribute, value_id in
+                                zip(TOKEN_ATTRIBUTES, self.values['token'][token_id])) for token_id in token_ids}
+
+    def add_token_values(self, token_values):
+        """
+        Adds tokens returned by get_token_values (possibly of another vocabulary) to this vocabulary.
+        :param token_values:
+        :return: A dictionary that maps token ids of given tokens to token ids in this vocabulary.
+        """
+        return {token_id: self.get_id('token', tuple(self.get_id(attribute, value) for attribute, value in
+                                                     zip(TOKEN_ATTRIBUTES, values)))
+                for token_id, values in token_values.items()}
+
+    def update(self, other):
+        """
+        Adds all values of other vocabulary to this one.
+        :param other:
+        :return: A list that maps token ids of other vocabulary to token ids of this one.
+        """
+        mappings = [[self.get_id(attribute, value) for value in other.values[attribute]]
+                    for attribute in TOKEN_ATTRIBUTES]
+        return [self.get_id('token', tuple(mapping[value_id] for mapping, value_id in zip(mappings, token)))
+                for token in other.values['token']]
@@ -12,28 +12,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import hashlib
 import os
+import signal
+import threading
+import time
 
 import logging
 from pathlib import Path
 
 from stark.data.document import Document
 from stark.data.summary import Summary
-from stark.utils import load_zipped_pickle, save_zipped_pickle
+from stark.processing.internal_saves import InternalSaves
+from stark.processing.readers import find_conllu_files
+from stark.utils import load_zipped_pickle, save_zipped_pickle, append_zipped_pickle, load_zipped_pickles
 
 logger = logging.getLogger('stark')
 
+# settings that change trees stored in DocumentCache
+DOCUMENT_CACHE_SETTINGS = ['label_subtypes', 'greedy_counter', 'columnar_corpus', 'mmap_corpus']
+# journal of processed files is not compacted into snapshot before it reaches this size (in bytes)
+MIN_JOURNAL_COMPACTION_SIZE = 16 * 1024 * 1024
+# settings that only affect speed of processing, storage of intermediate results or output paths, so they do not
+# change counted results (all other settings are part of ResultCache fingerprint)
+RESULT_CACHE_IGNORED_SETTINGS = ['input_path', 'other_input_path', 'output', 'internal_saves', 'cache_compression',
+                                 'result_cache_size', 'internal_saves_size', 'cpu_cores', 'continuation_processing',
+                                 'checkpoint_sentences', 'checkpoint_seconds', 'streaming', 'conllu_reader',
+                                 'parallel_parsing', 'columnar_corpus']
+
 
 class ProcessorCache(object):
     """
-    Caching class, used as a wrapper for processing multiple files. It enables continuation processing.
+    Caching class, used as a wrapper for processing multiple files. It enables continuation processing. Results of each
+    processed file are appended to a journal, which is periodically compacted into a snapshot of the whole summary.
     """
     def __init__(self, processor):
         self.configs = processor.configs
         self.already_processed = set()
         self._checkpoint_path = Path(self.configs['internal_saves'], 'checkpoint.pkl') \
             if self.configs['internal_saves'] is not None else None
+        self._journal_path = Path(self.configs['internal_saves'], 'checkpoint_journal.pkl') \
+            if self.configs['internal_saves'] is not None else None
+        self.internal_saves = InternalSaves.create_from_configs(self.configs)
         self.processor = processor
 
     def load_cache(self, summary):
@@ -42,12 +63,19 @@ class ProcessorCache(object):
         :return:
         summary: Either received summary or loaded one.
         """
-        if (self._checkpoint_path is None or not self._checkpoint_path.exists() or
-                not self.configs['continuation_processing']):
-            if self._checkpoint_path is not None and self._checkpoint_path.exists():
-                os.remove(self._checkpoint_path)
-        else:
-            return self._load_cache()
+        if self._checkpoint_path is None:
+            return summary
+
+        if not self.configs['continuation_processing']:
+            for path in [self._checkpoint_path, self._journal_path]:
+                if path.exists():
+                    os.remove(path)
+            return summary
+
+        if self._checkpoint_path.exists():
+            summary = self._load_cache()
+        if self._journal_path.exists():
+            summary = self._load_journal(summary)
         return summary
 
     def _load_cache(self):
@@ -60,15 +88,51 @@ class ProcessorCache(object):
         summary = Summary.create_summary_from_cache(summary_data)
         return summary
 
+    def _load_journal(self, summary):
+        """
+        Adds results of files stored in journal to summary.
+        :param summary: Summary loaded from snapshot.
+        :return:
+        """
+        journal_end = 0
+        for (path, journal_data), journal_end in load_zipped_pickles(self._journal_path):
+            # files might already be in snapshot, when processing stopped during compaction
+            if path in self.already_processed:
+                continue
+            summary.merge(Summary.create_summary_from_journal(journal_data, summary.vocabulary),
+                          self.processor.filters)
+            self.already_processed.add(path)
+
+        # results of a file that was being appended when processing stopped are removed, so that results of
+        # files appended in this run can be read
+        if journal_end < self._journal_path.stat().st_size:
+            logger.info(f'Removing incomplete results from the end of {self._journal_path}.')
+            os.truncate(self._journal_path, journal_end)
+        return summary
+
     def _save_cache(self, summary):
         """
-        Actually saves cache.
+        Actually saves cache (snapshot of the whole summary) and empties journal.
         :return:
         """
         summary_data = summary.get_summary_data()
         save_zipped_pickle(
             (self.already_processed, summary_data),
-            self._checkpoint_path, protocol=2)
+            self._checkpoint_path, compresslevel=self.configs['cache_compression'])
+        self.internal_saves.add(self._checkpoint_path, 'checkpoint', self.configs['input_path'])
+        if self._journal_path.exists():
+            os.remove(self._journal_path)
+
+    def _save_journal(self, path, file_summary):
+        """
+        Appends results of a single file to journal.
+        :param path:
+        :param file_summary: Summary with results of file.
+        :return:
+        """
+        append_zipped_pickle((str(path), file_summary.get_journal_data()), self._journal_path,
+                             compresslevel=self.configs['cache_compression'])
+        self.internal_saves.add(self._journal_path, 'checkpoint', self.configs['input_path'])
 
     def process_trees(self, path, summary):
         """
@@ -78,48 +142,377 @@ class ProcessorCache(object):
         :return:
         summary: A collection of datapoints used for result generation.
         """
+        if self.is_processed(path):
+            return summary
+
+        # results of file are counted separately, so that only they are stored in journal
+        file_summary = Summary()
+        file_summary.set_query_trees(summary.query_trees)
+        file_summary.vocabulary = summary.vocabulary
+        file_summary = self.processor.run(path, file_summary)
+        summary.merge(file_summary, self.processor.filters)
+        self.add_processed(path, summary, file_summary)
+
+        return summary
+
+    def is_processed(self, path):
+        """
+        Checks whether document was already processed (in a previous run, when continuing processing).
+        :param path:
+        :return:
+        """
         if str(path) in self.already_processed:
             logger.info(f'Skipping: {str(path)}')
-            return summary
+            return True
+        return False
 
-        summary = self.processor.run(path, summary)
+    def add_processed(self, path, summary, file_summary):
+        """
+        Marks document as processed and stores its results when checkpointing is enabled. Journal is compacted into
+        snapshot when it grows larger than snapshot, so that the cost of checkpoints stays proportional to the size of
+        processed files.
+        :param path:
+        :param summary: Summary that contains results of all processed documents.
+        :param file_summary: Summary that only contains results of document.
+        :return:
+        """
         self.already_processed.add(str(path))
-        if self._checkpoint_path:
-            self._save_cache(summary)
+        if not self._checkpoint_path:
+            return
 
-        return summary
+        self._save_journal(path, file_summary)
+        snapshot_size = self._checkpoint_path.stat().st_size if self._checkpoint_path.exists() else 0
+        if self._journal_path.stat().st_size > max(snapshot_size, MIN_JOURNAL_COMPACTION_SIZE):
+            self._save_cache(summary)
 
 
 class DocumentCache(object):
     """
     Cache that stores generated sentence trees from files. When used, reading input files is not necessary anymore.
-    May be problematic if users modify input files and don't rename them.
+    Cache files are named by input path and settings that affect trees. Size and modification time of input file are
+    stored in cache, so trees are created again when input file changes.
     """
     def __init__(self, document_processor, path):
         configs = document_processor.processor.configs
         self.document_processor = document_processor
         self.path = path
-        self._internal_file = os.path.join(configs['internal_saves'], hashlib.sha1(path.encode('utf-8')).hexdigest()) \
+        self._internal_file = os.path.join(configs['internal_saves'], hashlib.sha1(
+            (path + DocumentCache.get_configs_fingerprint(configs)).encode('utf-8')).hexdigest()) \
             if configs['internal_saves'] is not None else None
-        # do not save cache if input is dir
-        self._save = not os.path.isdir(configs['input_path'])
+        self.internal_saves = InternalSaves.create_from_configs(configs)
+
+    @staticmethod
+    def get_configs_fingerprint(configs):
+        """
+        Returns a string that represents settings used for creating trees.
+        :param configs:
+        :return:
+        """
+        fingerprint = [f'{setting}={configs[setting]}' for setting in DOCUMENT_CACHE_SETTINGS]
+        # conllu sentences are only stored when annodoc files are written
+        fingerprint.append(f'annodoc={configs["annodoc_example_dir"] is not None}')
+        return '|'.join(fingerprint)
+
+    def get_file_stamp(self):
+        """
+        Returns size and modification time of input file.
+        :return:
+        """
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
 
     def create_trees(self, summary, configs):
-        if self._internal_file is None or not os.path.exists(self._internal_file) or not self._save:
+        document = None
+        if self._internal_file is not None and os.path.exists(self._internal_file):
+            document = self._load_cache(summary)
+
+        if document is None:
+            # summary may already contain other documents (when input is a directory)
+            previous_corpus_size = summary.corpus_size
             document = self.document_processor.create_trees(summary, configs)
 
-            if self._internal_file is not None and self._save:
-                self._save_cache(document, summary)
-        else:
-            document = self._load_cache(summary)
+            if self._internal_file is not None:
+                self._save_cache(document, summary.corpus_size - previous_corpus_size)
 
         return document
 
-    def _save_cache(self, document, summary):
-        document_data = document.get_document_data() + [summary.corpus_size, summary.feats_dict]
-        save_zipped_pickle(document_data, self._internal_file, protocol=2)
+    def _save_cache(self, document, corpus_size):
+        """
+        Stores trees of a document.
+        :param document:
+        :param corpus_size: Number of tokens in document.
+        :return:
+        """
+        document_data = [self.get_file_stamp()] + document.get_document_data() + [corpus_size]
+        configs = self.document_processor.processor.configs
+        save_zipped_pickle(document_data, self._internal_file, compresslevel=configs['cache_compression'])
+        self.internal_saves.add(self._internal_file, 'trees', self.path, DocumentCache.get_configs_fingerprint(configs))
 
     def _load_cache(self, summary):
+        """
+        Loads trees from cache. Returns None, when input file was changed after cache was stored.
+        :param summary:
+        :return:
+        """
         document_data = load_zipped_pickle(self._internal_file)
-        summary.corpus_size, summary.feats_dict = document_data[-2:]
-        return Document.create_document_from_cache(document_data[:-2])
+        if document_data[0] != self.get_file_stamp():
+            logger.info(f'Input file {self.path} changed, its trees will be created again.')
+            return None
+        self.internal_saves.use(self._internal_file)
+        summary.corpus_size += document_data[-1]
+        return Document.create_document_from_cache(document_data[1:-1], summary.vocabulary)
+
+
+class SentenceCheckpoint(object):
+    """
+    Checkpoint that stores intermediate results of a single file every `checkpoint_sentences` counted sentences or
+    every `checkpoint_seconds` seconds, so that processing of large files may continue after the last stored
+    sentence. When SIGTERM or SIGINT is received, results are stored at the next sentence boundary before processing
+    stops. Stored results are only used with unchanged input file and settings that affect counting. When byte offset
+    of the last counted sentence is known (uncompressed files), reading continues from it.
+    """
+    def __init__(self, processor, path, summary):
+        configs = processor.configs
+        self.configs = configs
+        self.path = path
+        self._checkpoint_path = Path(configs['internal_saves'],
+                                     hashlib.sha1(path.encode('utf-8')).hexdigest() + '_sentences.pkl')
+        # results are stored without tokens of file, tokens of counted sentences are stored separately
+        self._start_corpus_size = summary.corpus_size
+        self._counted_tokens = 0
+        # number of counted sentences from the beginning of file and sentences at the beginning of read document that
+        # are skipped (when it is read from the beginning)
+        self.counted_sentences = 0
+        self.skipped_sentences = 0
+        # statistics of sentences counted in this run, only with counts of trees in them when they are written
+        self._samples = []
+        # byte offset after the last counted sentence or None, when it is unknown
+        self.offset = None
+        self._last_counted_sentences = 0
+        self._last_time = time.time()
+        self._stop_signal = None
+        self._previous_handlers = {}
+        self._handler_pid = None
+        self.internal_saves = InternalSaves.create_from_configs(configs)
+
+    @staticmethod
+    def is_enabled(configs):
+        """
+        Checks whether intermediate results of files should be stored.
+        :param configs:
+        :return:
+        """
+        return configs['internal_saves'] is not None and (configs['checkpoint_sentences'] > 0 or
+                                                          configs['checkpoint_seconds'] > 0)
+
+    def get_stamp(self):
+        """
+        Returns size and modification time of file together with a fingerprint of settings that affect counting.
+        :return:
+        """
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns, ResultCache.get_settings_fingerprint(self.configs)
+
+    def load(self, summary):
+        """
+        Loads intermediate results of file, when continuing processing. Otherwise, stored results are deleted.
+        :param summary:
+        :return: Either received summary or loaded one.
+        """
+        if not self._checkpoint_path.exists():
+            return summary
+        if not self.configs['continuation_processing']:
+            self.remove()
+            return summary
+
+        stamp, counted_sentences, offset, counted_tokens, journal_data = load_zipped_pickle(self._checkpoint_path)
+        if stamp != self.get_stamp():
+            logger.info(f'Input file {self.path} or settings changed, it will be processed from the beginning.')
+            self.remove()
+            return summary
+
+        logger.info(f'Continuing processing of {self.path} after {counted_sentences} sentences.')
+        loaded_summary = Summary.create_summary_from_journal(journal_data, summary.vocabulary)
+        loaded_summary.set_query_trees(summary.query_trees)
+        self.counted_sentences = self._last_counted_sentences = counted_sentences
+        self._counted_tokens = counted_tokens
+        self.offset = offset
+        if offset is None:
+            # file is read from the beginning and counted sentences are skipped
+            self.skipped_sentences = counted_sentences
+        else:
+            # tokens of counted sentences are not read again
+            loaded_summary.corpus_size += counted_tokens
+        return loaded_summary
+
+    def save(self, summary):
+        """
+        Stores results of sentences counted so far.
+        :param summary:
+        :return:
+        """
+        checkpoint_summary = copy.copy(summary)
+        checkpoint_summary.corpus_size = self._start_corpus_size
+        checkpoint_summary.samples = summary.samples + self._samples
+        save_zipped_pickle((self.get_stamp(), self.counted_sentences, self.offset, self._counted_tokens,
+                            checkpoint_summary.get_journal_data()),
+                           self._checkpoint_path, compresslevel=self.configs['cache_compression'])
+        self.internal_saves.add(self._checkpoint_path, 'checkpoint', self.path)
+        self._last_counted_sentences = self.counted_sentences
+        self._last_time = time.time()
+
+    def update(self, summary, sentences):
+        """
+        Called after sentences are counted. Stores results when enough sentences were counted, enough time passed or
+        processing should stop.
+        :param summary:
+        :param sentences: Statistics of sentences that were counted after the previous update.
+        :return:
+        """
+        for sentence in sentences:
+            self._counted_tokens += len(sentence['tokens']) if 'tokens' in sentence else sentence['size']
+            self.offset = sentence.get('end')
+            if self.configs['sentence_count_file']:
+                self._samples.append({'id': sentence['id'], 'count': sentence['count']})
+        self.counted_sentences += len(sentences)
+        if (self._stop_signal is None and
+                not (0 < self.configs['checkpoint_sentences'] <=
+                     self.counted_sentences - self._last_counted_sentences) and
+                not (0 < self.configs['checkpoint_seconds'] <= time.time() - self._last_time)):
+            return
+
+        if self._stop_signal is not None:
+            self.stop(summary)
+        else:
+            self.save(summary)
+
+    def stop(self, summary):
+        """
+        Stores results of sentences counted so far and raises received signal again.
+        :param summary:
+        :return:
+        """
+        self.save(summary)
+        logger.info(f'Processing stopped after {self.counted_sentences} sentences of {self.path}.')
+        signum = self._stop_signal
+        self.restore_signal_handlers()
+        signal.raise_signal(signum)
+
+    @property
+    def stop_requested(self):
+        """
+        Checks whether SIGTERM or SIGINT was received and processing should stop.
+        :return:
+        """
+        return self._stop_signal is not None
+
+    def _handle_signal(self, signum, frame):
+        # worker processes forked before they set their own handlers are stopped immediately
+        if os.getpid() != self._handler_pid:
+            signal.signal(signum, signal.SIG_DFL)
+            signal.raise_signal(signum)
+            return
+        self._stop_signal = signum
+
+    def set_signal_handlers(self):
+        """
+        Postpones SIGTERM and SIGINT until results are stored at the next sentence boundary.
+        :return:
+        """
+        # signal handlers may only be set in main thread
+        if threading.current_thread() is not threading.main_thread():
+            return
+        self._handler_pid = os.getpid()
+        for signum in [signal.SIGTERM, signal.SIGINT]:
+            self._previous_handlers[signum] = signal.signal(signum, self._handle_signal)
+
+    def restore_signal_handlers(self):
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers = {}
+
+    def remove(self):
+        """
+        Deletes stored results (ie. when whole file was processed).
+        :return:
+        """
+        if self._checkpoint_path.exists():
+            os.remove(self._checkpoint_path)
+
+
+class ResultCache(object):
+    """
+    Cache that stores counted results (summaries) of whole inputs. Results are named by paths, sizes and modification
+    times of input files and all settings that affect counting, so repeated runs with the same configuration on
+    unchanged input skip counting. The least recently used results are deleted when cache grows over
+    `result_cache_size` megabytes.
+    """
+    def __init__(self, configs):
+        self.configs = configs
+        self._results_dir = Path(configs['internal_saves'], 'results') \
+            if configs['internal_saves'] is not None and configs['result_cache_size'] > 0 else None
+        self.internal_saves = InternalSaves.create_from_configs(configs)
+
+    def get_fingerprint(self, input_path):
+        """
+        Returns a hash of input files and settings that affect counting.
+        :param input_path: Path to input file or directory.
+        :return:
+        """
+        paths = find_conllu_files(input_path) if os.path.isdir(input_path) else [Path(input_path)]
+        fingerprint = [str(input_path)]
+        for path in paths:
+            stat = os.stat(path)
+            fingerprint.append(f'{path}:{stat.st_size}:{stat.st_mtime_ns}')
+        fingerprint.append(ResultCache.get_settings_fingerprint(self.configs))
+        return hashlib.sha1('|'.join(fingerprint).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_settings_fingerprint(configs):
+        """
+        Returns a string that represents all settings that affect counted results.
+        :param configs:
+        :return:
+        """
+        fingerprint = []
+        for setting, value in sorted(configs.items()):
+            if setting in RESULT_CACHE_IGNORED_SETTINGS:
+                continue
+            # only whether sentences, their counts and conllu are stored affects results, paths of files do not
+            if setting in ['annodoc_example_dir', 'annodoc_detailed_dir', 'sentence_count_file',
+                           'detailed_results_file']:
+                value = value is not None
+            fingerprint.append(f'{setting}={value!r}')
+        return '|'.join(fingerprint)
+
+    def load(self, input_path):
+        """
+        Returns stored results of input or None, when they are not stored.
+        :param input_path:
+        :return:
+        """
+        if self._results_dir is None:
+            return None
+
+        result_path = Path(self._results_dir, self.get_fingerprint(input_path))
+        if not result_path.exists():
+            return None
+        logger.info(f'Results of {input_path} loaded from {result_path}.')
+        self.internal_saves.use(result_path)
+        return Summary.create_summary_from_cache(load_zipped_pickle(result_path))
+
+    def save(self, input_path, summary):
+        """
+        Stores results of input and deletes the least recently used results when cache is too large.
+        :param input_path:
+        :param summary:
+        :return:
+        """
+        if self._results_dir is None:
+            return
+
+        fingerprint = self.get_fingerprint(input_path)
+        result_path = Path(self._results_dir, fingerprint)
+        save_zipped_pickle(summary.get_summary_data(), result_path, compresslevel=self.configs['cache_compression'])
+        self.internal_saves.add(result_path, 'results', str(input_path), fingerprint)
+        self.internal_saves.evict(self.configs['result_cache_size'] * 1024 * 1024, ['results'])
@@ -11,22 +11,99 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import gc
-import random
+import multiprocessing
+import signal
 from abc import abstractmethod
 from multiprocessing import Pool
 from tqdm import tqdm
 
+from stark.data.document import Document
+from stark.data.processing.columnar import ColumnarSentence, FlatTrees
+from stark.data.summary import Summary
+
+# number of sentences that are read ahead and distributed among workers when trees are streamed
+STREAM_BATCH_SIZE = 10000
+# number of consecutive sentences that are counted by a worker in a single task
+SENTENCES_PER_TASK = 200
+# seconds between checks whether processing should stop, while waiting for results of workers
+RESULT_POLL_SECONDS = 0.5
+
+# state of worker processes, that is sent to each worker only once (when pool is created): counter that counts
+# sentences of worker (with corpus vocabulary, query trees, filters and settings) and trees and statistics of sentences
+# of document (forked workers inherit them without copying)
+_worker_counter = None
+_worker_trees = None
+_worker_sentences = None
+
+
+def _init_worker(counter_class, vocabulary, query_trees, filters, configs, corpus, trees, sentences):
+    """
+    Initializes worker process.
+    :param counter_class: Class of counter that is used in worker.
+    :param vocabulary: Vocabulary used for creating trees of columnar sentences.
+    :param query_trees:
+    :param filters:
+    :param configs:
+    :param corpus: Memory mapped corpus of document or None.
+    :param trees: Trees of document or None, when trees are sent with tasks.
+    :param sentences: Sentence statistics of document or None, when they are sent with tasks.
+    :return:
+    """
+    global _worker_counter, _worker_trees, _worker_sentences
+    # SIGINT (ie. Ctrl+C in terminal) is handled by parent, which stores results and terminates pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    document = Document(vocabulary)
+    document.corpus = corpus
+    summary = Summary()
+    summary.vocabulary = vocabulary
+    summary.set_query_trees(query_trees)
+    _worker_counter = counter_class(document, summary, filters, configs)
+    _worker_trees = trees
+    _worker_sentences = sentences
+
+
+def _count_sentences(task):
+    """
+    Counts a range of sentences in worker process. Results are aggregated in worker, so that only counts of distinct
+    trees are sent back.
+    :param task: A tuple of start and end position of sentences, their columnar trees, statistics and values of their
+    tokens (None, when worker already has them).
+    :return: A tuple of representation trees, unigrams, max tree size and counts of trees in each sentence (only when
+    they are needed).
+    """
+    start, end, trees, sentences, token_values = task
+    summary = _worker_counter.summary
+    token_mapping = None
+    if trees is None:
+        trees, sentences = _worker_trees[start:end], _worker_sentences[start:end]
+    else:
+        # tokens of sent trees may have been read after worker received vocabulary, so their ids are remapped
+        token_mapping = summary.vocabulary.add_token_values(token_values)
+        for tree in trees:
+            tree.remap_tokens(token_mapping)
+    summary.representation_trees, summary.unigrams, summary.max_tree_size = {}, {}, 0
+    _worker_counter.count_range(trees, sentences)
+    if token_mapping is not None:
+        parent_ids = {worker_id: token_id for token_id, worker_id in token_mapping.items()}
+        summary.unigrams = {parent_ids[token_id]: number for token_id, number in summary.unigrams.items()}
+    sentence_counts = [sentence['count'] for sentence in sentences] \
+        if _worker_counter.filters['sentence_count_file'] else None
+    return summary.representation_trees, summary.unigrams, summary.max_tree_size, sentence_counts
+
 
 class Counter(object):
     """
     A class designed for counting subtrees.
     """
-    def __init__(self, document, summary, filters, configs):
+    def __init__(self, document, summary, filters, configs, checkpoint=None):
         self.document = document
         self.summary = summary
         self.filters = filters
         self.configs = configs
+        # SentenceCheckpoint that stores intermediate results (sentences it already counted are skipped)
+        self.checkpoint = checkpoint
+        self.skipped_sentences = checkpoint.skipped_sentences if checkpoint is not None else 0
 
     def run(self):
         """
@@ -38,71 +115,216 @@ class Counter(object):
         else:
             self.run_single_processor()
 
+    def run_stream(self, sentence_trees):
+        """
+        Counts trees as they are read, so that only trees of currently processed sentences are kept in memory.
+        :param sentence_trees: An iterable of (tree, sentence) pairs.
+        :return:
+        """
+        if self.filters['cpu_cores'] > 1:
+            # a single pool counts the whole stream, compact trees of each batch are sent with tasks
+            with tqdm(desc='Creating subtrees') as pbar, self._create_pool() as p:
+                batch_trees, batch_sentences = [], []
+                first_sentence_i = 0
+                for tree, sentence in sentence_trees:
+                    batch_trees.append(tree)
+                    batch_sentences.append(sentence)
+                    if len(batch_trees) == STREAM_BATCH_SIZE:
+                        self._count_batch(p, batch_trees, batch_sentences, pbar, first_sentence_i)
+                        first_sentence_i += len(batch_trees)
+                        batch_trees, batch_sentences = [], []
+                self._count_batch(p, batch_trees, batch_sentences, pbar, first_sentence_i)
+        else:
+            for sentence_i, (tree, sentence) in enumerate(tqdm(sentence_trees, desc='Processing')):
+                if sentence_i >= self.skipped_sentences:
+                    self._count_tree(tree, sentence)
+                    self._sentences_counted([sentence])
+                self._keep_streamed_statistics([sentence])
+
+    def _keep_streamed_statistics(self, sentences):
+        """
+        Keeps statistics of streamed sentences that were counted (or skipped), only when counts of trees in sentences
+        are written. Tokens are not kept, so that memory does not grow with the size of the corpus.
+        :param sentences: A list of sentence statistics.
+        :return:
+        """
+        if self.filters['sentence_count_file']:
+            self.document.sentence_statistics.extend({'id': sentence['id'], 'count': sentence['count']}
+                                                     for sentence in sentences)
+
     @staticmethod
     @abstractmethod
     def tree_calculations(input_data):
         return []
 
+    @staticmethod
+    def shares_trees():
+        """
+        Checks whether workers inherit trees of document from parent process without copying (when they are forked).
+        :return:
+        """
+        return multiprocessing.get_start_method() == 'fork'
+
+    def _create_pool(self, trees=None, sentences=None):
+        """
+        Creates a pool of workers, that receive filters, query trees and vocabulary only once.
+        :param trees: Trees of document, that are inherited by forked workers (None, when they are sent with tasks).
+        :param sentences: Sentence statistics that belong to trees.
+        :return:
+        """
+        return Pool(self.filters['cpu_cores'], initializer=_init_worker,
+                    initargs=(type(self), self.summary.vocabulary, self.summary.query_trees, self.filters, self.configs,
+                              self.document.corpus, trees, sentences))
+
     def run_multiprocessor(self):
         """
         Runs processing on multiple cores.
         :return:
         """
-        with Pool(self.filters['cpu_cores']) as p:
-            all_unigrams = p.map(self.get_unigrams,
-                                 [(tree, self.filters) for tree in self.document.trees])
-            for unigrams in all_unigrams:
-                for unigram in unigrams:
-                    if unigram in self.summary.unigrams:
-                        self.summary.unigrams[unigram] += 1
-                    else:
-                        self.summary.unigrams[unigram] = 1
-
-            i = 0
-            with tqdm(desc='Creating subtrees', total=len(self.document.trees)) as pbar:
-                for subtrees in p.imap(self.tree_calculations,
-                                                [(tree, self.summary.query_trees, self.filters) for tree in self.document.trees]):
-
-                    for subtree in subtrees:
-                        self.postprocess_query_results(subtree, self.document.sentence_statistics[i])
-                    i += 1
-                    pbar.update()
-                    # if i % 1000 == 0:
-                    #     gc.collect()
+        shared_trees = Counter.shares_trees()
+        with self._create_pool(*((self.document.trees, self.document.sentence_statistics) if shared_trees else ())) as p, \
+                tqdm(desc='Creating subtrees', total=len(self.document.trees)) as pbar:
+            self._count_multiprocessor(p, self.document.trees, self.document.sentence_statistics, pbar,
+                                       shared_trees=shared_trees)
+
+    def _count_batch(self, p, trees, sentences, pbar, first_sentence_i):
+        """
+        Counts a batch of streamed sentences.
+        :param p: Pool of workers.
+        :param trees: List of sentence trees.
+        :param sentences: List of sentence statistics that belong to trees.
+        :param pbar: Progress bar.
+        :param first_sentence_i: Position of the first given sentence in file.
+        :return:
+        """
+        if first_sentence_i + len(trees) <= self.skipped_sentences:
+            pbar.update(len(trees))
+        else:
+            self._count_multiprocessor(p, trees, sentences, pbar, first_sentence_i)
+        self._keep_streamed_statistics(sentences)
+
+    def _count_multiprocessor(self, p, trees, sentences, pbar, first_sentence_i=0, shared_trees=False):
+        """
+        Counts trees of given sentences with a pool of workers. Each worker counts ranges of consecutive sentences and
+        their results are merged in the order of sentences, so they are the same as when counted on a single core.
+        :param p: Pool of workers.
+        :param trees: List of sentence trees.
+        :param sentences: List of sentence statistics that belong to trees.
+        :param pbar: Progress bar.
+        :param first_sentence_i: Position of the first given sentence in file.
+        :param shared_trees: Whether workers already have trees (otherwise they are sent with tasks).
+        :return:
+        """
+        skipped = min(max(0, self.skipped_sentences - first_sentence_i), len(trees))
+        pbar.update(skipped)
+
+        tasks = []
+        for start in range(skipped, len(trees), SENTENCES_PER_TASK):
+            end = min(start + SENTENCES_PER_TASK, len(trees))
+            if shared_trees:
+                tasks.append((start, end, None, None, None))
+            else:
+                task_trees, token_values = self._get_task_trees(trees[start:end])
+                tasks.append((start, end, task_trees, sentences[start:end], token_values))
+
+        results_iterator = p.imap(_count_sentences, tasks)
+        for start, end, *_ in tasks:
+            results = self._next_results(p, results_iterator)
+            task_summary = Summary()
+            task_summary.vocabulary = self.summary.vocabulary
+            task_summary.representation_trees, task_summary.unigrams, task_summary.max_tree_size, sentence_counts = \
+                results
+            self.summary.merge(task_summary, self.filters)
+            # statistics of sentences were only changed in worker
+            if sentence_counts is not None:
+                for sentence, counts in zip(sentences[start:end], sentence_counts):
+                    sentence['count'] = counts
+            pbar.update(end - start)
+            self._stop_workers_if_requested(p)
+            self._sentences_counted(sentences[start:end])
+
+    def _get_task_trees(self, trees):
+        """
+        Converts trees that are sent to a worker to compact columnar sentences, which are sent together with values of
+        their tokens, so that workers do not need the vocabulary of parent process.
+        :param trees: List of sentence trees (or columnar sentences).
+        :return: A tuple of columnar sentences and values of their tokens.
+        """
+        task_trees = [tree if isinstance(tree, ColumnarSentence) else FlatTrees(tree) for tree in trees]
+        token_ids = {token_id for tree in task_trees for token_id in tree.get_column('token')}
+        return task_trees, self.summary.vocabulary.get_token_values(token_ids)
+
+    def _next_results(self, p, results_iterator):
+        """
+        Waits for results of the next task. When processing should stop in the meantime, workers are terminated and
+        results of sentences counted so far are stored.
+        :param p: Pool of workers.
+        :param results_iterator: Iterator over results of tasks.
+        :return:
+        """
+        while True:
+            try:
+                return results_iterator.next(timeout=RESULT_POLL_SECONDS)
+            except multiprocessing.TimeoutError:
+                if self._stop_workers_if_requested(p):
+                    self.checkpoint.stop(self.summary)
+
+    def _stop_workers_if_requested(self, p):
+        """
+        Terminates workers when SIGTERM or SIGINT was received, before results are stored and signal is raised again.
+        :param p: Pool of workers.
+        :return: Whether workers were terminated.
+        """
+        if self.checkpoint is None or not self.checkpoint.stop_requested:
+            return False
+        p.terminate()
+        return True
 
     def run_single_processor(self):
         """
         Runs processing on single core.
         :return:
         """
-        for tree, sentence in tqdm(zip(self.document.trees, self.document.sentence_statistics), desc='Processing',
-                                   total=len(self.document.trees)):
-            input_data = (tree, self.summary.query_trees, self.filters)
-            if self.filters['association_measures']:
-                unigrams = self.get_unigrams((tree, self.filters))
-                for unigram in unigrams:
-                    if unigram in self.summary.unigrams:
-                        self.summary.unigrams[unigram] += 1
-                    else:
-                        self.summary.unigrams[unigram] = 1
+        for sentence_i, (tree, sentence) in enumerate(tqdm(zip(self.document.trees, self.document.sentence_statistics),
+                                                           desc='Processing', total=len(self.document.trees))):
+            if sentence_i < self.skipped_sentences:
+                continue
+            self._count_tree(tree, sentence)
+            self._sentences_counted([sentence])
 
-            subtrees = self.tree_calculations(input_data)
-            for subtree in subtrees:
-                self.postprocess_query_results(subtree, sentence)
+    def count_range(self, trees, sentences):
+        """
+        Counts trees of a range of consecutive sentences into summary (ie. in worker process).
+        :param trees: List of sentence trees.
+        :param sentences: List of sentence statistics that belong to trees.
+        :return:
+        """
+        for tree, sentence in zip(trees, sentences):
+            self._count_tree(tree, sentence)
 
-    @staticmethod
-    def get_unigrams(input_data):
+    def _sentences_counted(self, sentences):
         """
-        Returns unigrams.
-        :param input_data:
+        Notifies checkpoint that given sentences, which follow all previously counted ones, were counted.
+        :param sentences: A list of sentence statistics.
         :return:
         """
-        tree, filters = input_data
-        unigrams = []
-        # there might be multiple roots in a sentence/tree
-        for tree_root in tree:
-            unigrams += tree_root.get_unigrams(filters['create_output_string_functs'])
-        return unigrams
+        if self.checkpoint is not None:
+            self.checkpoint.update(self.summary, sentences)
+
+    def _count_tree(self, tree, sentence):
+        """
+        Counts unigrams and subtrees of a single sentence tree.
+        :param tree:
+        :param sentence:
+        :return:
+        """
+        if isinstance(tree, ColumnarSentence):
+            tree = tree.create_trees(self.summary.vocabulary)
+        # unigrams are counted in the same traversal that generates subtrees, only when they are needed
+        unigrams = self.summary.unigrams if self.filters['association_measures'] else None
+        subtrees = self.tree_calculations((tree, self.summary.query_trees, self.filters, unigrams))
+        for subtree in subtrees:
+            self.postprocess_query_results(subtree, sentence)
 
     def recreate_sentence(self, sentence, r):
         """
@@ -112,12 +334,11 @@ class Counter(object):
         :return:
         """
         recreated_sentence = ''
-        subtree_node_positions = []
-        for token_i, token in enumerate(sentence['tokens']):
-            subtree_node_positions = r.get_order(self.filters)
+        subtree_node_positions = r.get_order(self.filters)
+        order_letters = r.get_order_letters(subtree_node_positions)
+        for token_i, token in enumerate(self.document.get_sentence_tokens(sentence)):
             if token_i + 1 in subtree_node_positions:
                 letter_position = subtree_node_positions.index(token_i + 1)
-                order_letters = r.get_order_letters(subtree_node_positions)
                 recreated_sentence += f'{order_letters[letter_position]}[{token[0]}]'
             else:
                 recreated_sentence += token[0]
@@ -132,18 +353,16 @@ class Counter(object):
         :param sentence:
         :return:
         """
-        key_raw, word_array = r.get_key_array(self.filters)
+        # keys are rendered only once per canonical code of subtree and order of its nodes
+        order_ranks = r.get_order_ranks(r.get_order(self.filters)) if self.filters['node_order'] else None
+        key, key_raw, word_array = self.filters['subtree_keys'].get_summary_key(r.get_key_id(self.filters), order_ranks,
+                                                                               r, self.filters)
         if self.filters['ignored_labels']:
             if self.filters['display_size_range'][0] and \
                     (len(word_array) > self.filters['display_size_range'][-1] or len(word_array) <
                      self.filters['display_size_range'][0]):
                 return
-        if self.filters['node_order']:
-            order_letters = r.get_order_letters(r.get_order(self.filters))
-            key = key_raw + order_letters
-        else:
-            key = key_raw
-        sentence_size = len(sentence['tokens']) if 'tokens' in sentence else 10000
+        sentence_size = len(sentence['tokens']) if 'tokens' in sentence else sentence.get('size', 10000)
         if key in self.summary.representation_trees:
             if self.filters['detailed_results_file']:
                 recreated_sentence, subtree_node_positions = self.recreate_sentence(sentence, r)
@@ -173,13 +392,13 @@ class Counter(object):
             if self.filters['example'] or self.filters['detailed_results_file']:
                 recreated_sentence, subtree_node_positions = self.recreate_sentence(sentence, r)
                 sentence_conll = (r.node.node.get_root().conll, subtree_node_positions) if self.filters['annodoc'] else None
-                sentence_size = len(sentence['tokens']) if 'tokens' in sentence else 10000
+                sentence_size = len(sentence['tokens']) if 'tokens' in sentence else sentence.get('size', 10000)
                 self.summary.representation_trees[key]['sentence'] = [(sentence['id'],
                                                                        recreated_sentence,
                                                                        sentence_conll,
                                                                        sentence_size)]
             if self.filters['node_order']:
-                self.summary.representation_trees[key]['order_letters'] = order_letters
+                self.summary.representation_trees[key]['order_letters'] = key[len(key_raw):]
                 if self.configs['depsearch']:
                     self.summary.representation_trees[key]['key_sorted'] = r.get_key_sorted(self.filters)[1:-1]
             if self.filters['print_root']:
@@ -203,11 +422,11 @@ class QueryCounter(Counter):
 
     @staticmethod
     def tree_calculations(input_data):
-        tree, query_trees, filters = input_data
+        tree, query_trees, filters, unigrams = input_data
         subtrees = []
         # there might be multiple roots in a sentence/tree
         for tree_root in tree:
-            _, subtrees_part = tree_root.get_subtrees(query_trees, [], filters)
+            _, subtrees_part = tree_root.get_subtrees(query_trees, [], filters, unigrams)
             subtrees += subtrees_part
         return [subtree for query_results in subtrees for subtree in query_results]
 
@@ -222,15 +441,38 @@ class GreedyCounter(Counter):
 
     @staticmethod
     def tree_calculations(input_data):
-        tree, query_trees, filters = input_data
-        subtrees = []
+        tree, query_trees, filters, unigrams = input_data
+        # subtrees are generated one at a time and they are only stored when they pass filters
         # there might be multiple roots in a sentence/tree
-        for tree_root in tree:
-            _, subtrees_part = tree_root.get_subtrees(filters)
-            subtrees += subtrees_part
+        subtrees = (subtree for tree_root in tree for subtree in tree_root.get_subtrees(filters, unigrams))
+
+        if filters['mining'] is not None and filters['mining'][1] is not None:
+            return GreedyCounter.get_support_subtrees(subtrees, filters)
+        return GreedyCounter.filter_subtrees(query_trees, subtrees, filters)
 
-        subtrees = GreedyCounter.filter_subtrees(query_trees, subtrees, filters)
-        return subtrees
+    @staticmethod
+    def get_support_subtrees(subtrees, filters):
+        """
+        Yields a single tree of each key per root node among trees whose support is being counted, so that their
+        counts are numbers of nodes at which they are rooted.
+        :param subtrees:
+        :param filters:
+        :return:
+        """
+        size = filters['mining'][1]
+        root = None
+        root_keys = set()
+        for subtree in subtrees:
+            if subtree.tree_size != size:
+                continue
+            # trees with the same root are generated one after another
+            if subtree.node.node is not root:
+                root = subtree.node.node
+                root_keys = set()
+            key = subtree.get_summary_key(filters)
+            if key not in root_keys:
+                root_keys.add(key)
+                yield subtree
 
     @staticmethod
     def filter_subtrees(query_trees, subtrees, filters):
@@ -241,4 +483,4 @@ class GreedyCounter(Counter):
         :param filters:
         :return:
         """
-        return [subtree.ignore_labels(filters) for subtree in subtrees if subtree.pass_filter(query_trees, filters)]
+        return (subtree.ignore_labels(filters) for subtree in subtrees if subtree.pass_filter(query_trees, filters))
@@ -11,16 +11,15 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import gc
 import logging
-import os
-
-import pyconll
 
 from stark.data.document import Document
+from stark.data.processing.columnar import ColumnarSentence
 from stark.data.processing.greedy_tree import GreedyTree
 from stark.data.processing.query_tree import QueryTree
+from stark.data.processing.tree import Tree
 from stark.processing.cache import DocumentCache
+from stark.processing.readers import create_reader
 
 logger = logging.getLogger('stark')
 
@@ -29,10 +28,12 @@ class DocumentProcessor(object):
     """
     A class that processes document.
     """
-    def __init__(self, path, processor):
+    def __init__(self, path, processor, byte_range=None, record_offsets=False):
         self.path = path
         self.processor = processor
+        self.byte_range = byte_range
         self.cache = DocumentCache(self, path)
+        self.reader = create_reader(path, processor.configs, byte_range, record_offsets)
 
     def form_trees(self, summary, configs):
         """
@@ -40,6 +41,9 @@ class DocumentProcessor(object):
         :param summary:
         :return:
         """
+        # parts of files are not cached
+        if self.byte_range is not None:
+            return self.create_trees(summary, configs)
         return self.cache.create_trees(summary, configs)
 
     def create_trees(self, summary, configs):
@@ -48,63 +52,93 @@ class DocumentProcessor(object):
         :param summary:
         :return:
         """
-        document = Document()
+        document = Document(summary.vocabulary)
+
+        if configs['columnar_corpus']:
+            # trees are only created from compact sentences when they are counted
+            tree_class = GreedyTree if configs['greedy_counter'] else QueryTree
+            for token_rows, heads, sentence_conll, sentence_statistics in self.iterate_sentences(document, summary,
+                                                                                                 configs):
+                document.trees.append(ColumnarSentence(token_rows, heads, sentence_conll, tree_class,
+                                                       summary.vocabulary))
+                document.sentence_statistics.append(sentence_statistics)
+            return document
+
+        for roots, sentence_statistics in self.iterate_trees(document, summary, configs):
+            document.trees.append(roots)
+            document.sentence_statistics.append(sentence_statistics)
 
-        logger.info("Reading file: " + self.path)
-        train = pyconll.load_from_file(self.path)
+        return document
 
-        for sentence in train:
+    def iterate_trees(self, document, summary, configs):
+        """
+        Reads file one sentence at a time and yields its trees together with sentence statistics. Only token attributes
+        are stored in corpus vocabulary, so memory is bounded by the largest sentence (when streamed sentences are
+        counted, only their ids and counts of trees are kept and only when sentence counts are written).
+        :param document:
+        :param summary:
+        :param configs:
+        :return:
+        """
+        tree_class = GreedyTree if configs['greedy_counter'] else QueryTree
+        for token_rows, heads, sentence_conll, sentence_statistics in self.iterate_sentences(document, summary,
+                                                                                             configs):
             token_nodes = []
+            for (index, form, lemma, upos, xpos, deprel, feats), head in zip(token_rows, heads):
+                token_id = summary.vocabulary.add_token(form, lemma, upos, xpos, deprel, feats)
+                # interned values are shared by all tokens
+                form, lemma, upos, xpos, deprel, feats = summary.vocabulary.get_token(token_id)
+                token_nodes.append(tree_class(index, form, lemma, upos, xpos, deprel, head, feats, token_id))
+
+            yield Tree.link_nodes(token_nodes, heads, sentence_conll), sentence_statistics
+
+    def iterate_sentences(self, document, summary, configs):
+        """
+        Reads file one sentence at a time and yields its token rows of (index, form, lemma, upos, xpos, deprel, feats)
+        together with heads of tokens, sentence in CoNLL-U format (only when it is needed) and sentence statistics.
+        :param document:
+        :param summary:
+        :param configs:
+        :return:
+        """
+        logger.info("Reading file: " + self.path)
+        document.corpus = self.reader.corpus
+
+        for sentence_id, reader_rows, sentence_conll, sentence_span in self.reader.sentences():
+            token_rows = []
+            heads = []
             tokens = []
-            for token in sentence:
-                if not token.id.isdigit():
-                    continue
-
-                token_form = token.form if token.form is not None else '_'
-                token_deprel = token.deprel if self.processor.configs['label_subtypes'] \
-                    else token.deprel.split(':')[0]
-                if self.processor.configs['greedy_counter']:
-                    node = GreedyTree(int(token.id), token_form, token.lemma, token.upos, token.xpos, token_deprel,
-                                      token.head, token.feats, document, summary)
-                else:
-                    node = QueryTree(int(token.id), token_form, token.lemma, token.upos, token.xpos, token_deprel,
-                                     token.head, token.feats, document, summary)
-                token_nodes.append(node)
-                space_after = token.misc[
-                                  'SpaceAfter'].pop() != 'No' if token.misc is not None and 'SpaceAfter' in token.misc \
-                    else True
+            for token_id, form, lemma, upos, xpos, feats, head, deprel, space_after in reader_rows:
+                token_form = form if form is not None else '_'
+                token_deprel = deprel if self.processor.configs['label_subtypes'] else deprel.split(':')[0]
+                token_rows.append((token_id, token_form, lemma, upos, xpos, token_deprel, feats))
+                heads.append(head)
                 tokens.append((token_form, space_after))
 
                 summary.corpus_size += 1
-            document.sentence_statistics.append({'id': sentence.id, 'tokens': tokens, 'count': {}})
-            roots = []
-            for token_id, token in enumerate(token_nodes):
-                if isinstance(token.parent, int) or token.parent == '':
-                    logger.warning('No parent: ' + sentence.id)
+            if sentence_span is None:
+                sentence_statistics = {'id': sentence_id, 'tokens': tokens, 'count': {}}
+            else:
+                # tokens are read from memory mapped file only when sentence is used as an example
+                sentence_statistics = {'id': sentence_id, 'span': sentence_span, 'size': len(tokens), 'count': {}}
+            if self.reader.record_offsets and self.reader.end_offset is not None:
+                # processing may continue after sentence
+                sentence_statistics['end'] = self.reader.end_offset
+
+            # tokens after the first one without a parent are not connected
+            for token_i, head in enumerate(heads):
+                if head is None or head == '':
+                    logger.warning('No parent: ' + sentence_id)
+                    heads[token_i:] = [-1] * (len(heads) - token_i)
                     break
-                if int(token.parent) == 0:
-                    token.set_parent(None)
-                    # add a conllu string if necessary
-                    if configs['annodoc_example_dir'] is not None:
-                        token.add_conll_sentence(sentence.conll())
-                    roots.append(token)
-                else:
-                    parent_id = int(token.parent) - 1
-                    if token_nodes[parent_id].children_split == -1 and token_id > parent_id:
-                        token_nodes[parent_id].children_split = len(token_nodes[parent_id].children)
-                    token_nodes[parent_id].add_child(token)
-                    token.set_parent(token_nodes[parent_id])
-
-            for token in token_nodes:
-                if token.children_split == -1:
-                    token.children_split = len(token.children)
-
-            if not roots:
-                logger.warning('No root: ' + sentence.id)
+                heads[token_i] = int(head)
 
-            document.trees.append(roots)
+            if 0 not in heads:
+                logger.warning('No root: ' + sentence_id)
 
-        del train
-        gc.collect()
+            if configs['annodoc_example_dir'] is not None:
+                sentence_conll = sentence_conll() if sentence_span is None else (self.path, sentence_span)
+            else:
+                sentence_conll = None
 
-        return document
+            yield token_rows, heads, sentence_conll, sentence_statistics
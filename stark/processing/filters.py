@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from stark.data.representation.subtree_keys import SubtreeKeys
 from stark.utils import create_output_string_deprel, create_output_string_lemma, create_output_string_upos, \
     create_output_string_xpos, create_output_string_feats, create_output_string_form, create_output_string_none
 
@@ -78,7 +79,11 @@ def read_filters(configs):
         'nodes_number': configs['nodes_number'],
         'frequency_threshold': configs['frequency_threshold'],
         'lines_threshold': configs['lines_threshold'],
-        'print_root': configs['print_root']
+        'print_root': configs['print_root'],
+        # keys of frequent trees and size of trees whose support is counted (set only while mining)
+        'mining': None,
+        # canonical codes of subtrees, that are used instead of building keys of each subtree
+        'subtree_keys': SubtreeKeys()
     }
 
     if configs['root_whitelist']:
@@ -161,19 +166,19 @@ class Filter(object):
         """
         Checks if feats of a tree fit feats of option.
         :param option:
-        :param feats:
+        :param feats: FeatureBundle of a tree.
         :return:
         """
         if 'feats_detailed' not in option:
             return True
 
-        for feat in option['feats_detailed'].keys():
-            if feat not in feats:
-                if not option['feats_detailed'][feat][0]:
+        # each feat is looked up in bundle only once
+        for feat, (negation, value) in option['feats_detailed'].items():
+            feat_value = feats.get(feat)
+            if feat_value is None:
+                if not negation:
                     return False
-            elif option['feats_detailed'][feat][1] != feats[feat] and not option['feats_detailed'][feat][0]:
-                return False
-            elif option['feats_detailed'][feat][1] == feats[feat] and option['feats_detailed'][feat][0]:
+            elif (feat_value == value) == negation:
                 return False
         return True
 
@@ -194,7 +199,7 @@ class Filter(object):
         :param form:
         :param lemma:
         :param upos:
-        :param feats:
+        :param feats: FeatureBundle of a tree.
         :param deprel:
         :param filters:
         :return:
@@ -205,17 +210,15 @@ class Filter(object):
         for option in filters['root_whitelist']:
             filter_passed = True
             # check if attributes are valid
-            for key in option.keys():
+            for key, (negation, value) in option.items():
                 if key not in ROOT_WHITELIST_OPTIONS:
+                    feat_value = feats.get(key)
                     # key not in feats and not negated
-                    if key not in feats:
-                        if not option[key][0]:
+                    if feat_value is None:
+                        if not negation:
                             filter_passed = False
-                    # key different, then in head and not negated
-                    elif option[key][1] != feats[key] and not option[key][0]:
-                        filter_passed = False
-                    # key equal, and negated
-                    elif option[key][1] == feats[key] and option[key][0]:
+                    # key different and not negated or key equal and negated
+                    elif (feat_value == value) == negation:
                         filter_passed = False
 
             filter_passed = filter_passed and \
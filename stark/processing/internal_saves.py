@@ -0,0 +1,203 @@
+# Copyright 2024 CJVT
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+logger = logging.getLogger('stark')
+
+MANIFEST_NAME = 'manifest.jsonl'
+# kinds of stored files, only caches may be deleted when folder grows over its size
+CACHE_KINDS = ['trees', 'results']
+CHECKPOINT_NAMES = ['checkpoint.pkl', 'checkpoint_journal.pkl']
+
+
+class InternalSaves(object):
+    """
+    Manager of `internal_saves` folder. It keeps a manifest of stored files (their source path, fingerprint of
+    settings, size and last use) and deletes the least recently used caches when folder grows over `max_size` bytes.
+    Manifest is a file of JSON lines, to which each use of a file is appended (later lines of a file update earlier
+    ones), so that it may be updated by several processes at once. It is rewritten when files are deleted.
+    """
+    def __init__(self, path, max_size=0):
+        """
+        :param path: Path to internal_saves folder.
+        :param max_size: Maximal size of folder in bytes (0 for no limit).
+        """
+        self.path = Path(path)
+        self.max_size = max_size
+        self._manifest_path = Path(path, MANIFEST_NAME)
+        self._temporary_manifest_path = Path(path, MANIFEST_NAME + '.tmp')
+        self._manifest_lines = 0
+
+    @classmethod
+    def create_from_configs(cls, configs):
+        """
+        Returns manager of internal_saves folder or None, when internal saves are not used.
+        :param configs:
+        :return:
+        """
+        if configs['internal_saves'] is None:
+            return None
+        return cls(configs['internal_saves'], configs['internal_saves_size'] * 1024 * 1024)
+
+    @staticmethod
+    def _get_kind(name):
+        """
+        Returns kind of a file that is not in manifest (ie. stored by an older version).
+        :param name: Path of file relative to internal_saves folder.
+        :return:
+        """
+        path = Path(name)
+        if path.name in CHECKPOINT_NAMES or path.name.endswith('_sentences.pkl'):
+            return 'checkpoint'
+        if path.parent.name == 'results':
+            return 'results'
+        return 'trees'
+
+    def add(self, file_path, kind, source=None, fingerprint=None):
+        """
+        Adds a stored file to manifest and deletes the least recently used caches when folder is too large.
+        :param file_path: Path to stored file.
+        :param kind: One of 'trees', 'results' or 'checkpoint'.
+        :param source: Path to input file or directory, whose data is stored.
+        :param fingerprint: Settings that were used for creating data.
+        :return:
+        """
+        self._append_entry({'file': self._get_name(file_path), 'kind': kind, 'source': source,
+                            'fingerprint': fingerprint, 'size': os.path.getsize(file_path), 'last_use': time.time()})
+        if self.max_size > 0:
+            self.evict(self.max_size)
+
+    def use(self, file_path):
+        """
+        Marks file as used (only its last use is appended to manifest).
+        :param file_path:
+        :return:
+        """
+        self._append_entry({'file': self._get_name(file_path), 'last_use': time.time()})
+
+    def read_manifest(self):
+        """
+        Returns entries of all files in folder. Files that are not in manifest get their kind from their name and last
+        use from their modification time.
+        :return: A dictionary that maps paths of files (relative to folder) to their entries.
+        """
+        entries = {}
+        self._manifest_lines = 0
+        if self._manifest_path.exists():
+            with open(self._manifest_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._manifest_lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # line may be incomplete when writing was interrupted
+                        continue
+                    # later lines update values of earlier ones
+                    entries[entry['file']] = dict(entries.get(entry['file'], {}), **entry)
+
+        manifest = {}
+        for file_path in sorted(self.path.rglob('*')):
+            if not file_path.is_file() or file_path in [self._manifest_path, self._temporary_manifest_path]:
+                continue
+            name = self._get_name(file_path)
+            stat = file_path.stat()
+            entry = {'file': name, 'kind': InternalSaves._get_kind(name), 'source': None, 'fingerprint': None,
+                     'last_use': stat.st_mtime}
+            entry.update(entries.get(name, {}))
+            manifest[name] = dict(entry, size=stat.st_size)
+        return manifest
+
+    def evict(self, max_size, kinds=None):
+        """
+        Deletes the least recently used caches until folder fits into max_size bytes.
+        :param max_size: Maximal size of folder in bytes.
+        :param kinds: Kinds of files that are deleted and counted in size of folder (all caches by default).
+        :return: A list of deleted entries.
+        """
+        kinds = CACHE_KINDS if kinds is None else kinds
+        manifest = self.read_manifest()
+        entries = sorted((entry for entry in manifest.values() if entry['kind'] in kinds),
+                         key=lambda entry: entry['last_use'])
+        size = sum(entry['size'] for entry in entries)
+        deleted = []
+        for entry in entries:
+            if size <= max_size:
+                break
+            try:
+                os.remove(Path(self.path, entry['file']))
+            except FileNotFoundError:
+                # file was already deleted by another process
+                pass
+            size -= entry['size']
+            del manifest[entry['file']]
+            deleted.append(entry)
+
+        if deleted:
+            logger.info(f'Deleted {len(deleted)} least recently used files from {self.path}.')
+        # manifest is compacted when it contains mostly outdated lines
+        if deleted or self._manifest_lines > 2 * len(manifest) + 100:
+            self._write_manifest(manifest.values())
+        return deleted
+
+    def _get_name(self, file_path):
+        return Path(file_path).relative_to(self.path).as_posix()
+
+    def _append_entry(self, entry):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self._manifest_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def _write_manifest(self, entries):
+        with open(self._temporary_manifest_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+        os.replace(self._temporary_manifest_path, self._manifest_path)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Inspects and prunes STARK internal_saves folder.')
+    parser.add_argument('command', choices=['list', 'prune'],
+                        help='Either lists stored files or deletes the least recently used caches.')
+    parser.add_argument('internal_saves', type=str, help='Path to internal_saves folder.')
+    parser.add_argument('--max_size', default=0, type=float,
+                        help='Size (in MB) to which caches are pruned (0 deletes all caches).')
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Lists files in internal_saves folder or prunes it.
+    :param args: Command line arguments.
+    :return:
+    """
+    args = parse_args(args)
+    internal_saves = InternalSaves(args.internal_saves)
+    if args.command == 'prune':
+        deleted = internal_saves.evict(args.max_size * 1024 * 1024)
+        print(f'Deleted {len(deleted)} files ({sum(entry["size"] for entry in deleted) / (1024 * 1024):.1f} MB).')
+        return
+
+    manifest = sorted(internal_saves.read_manifest().values(), key=lambda entry: entry['last_use'], reverse=True)
+    print('\t'.join(['File', 'Kind', 'Size (MB)', 'Last use', 'Source', 'Fingerprint']))
+    for entry in manifest:
+        print('\t'.join([entry['file'], entry['kind'], f'{entry["size"] / (1024 * 1024):.2f}',
+                         time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_use'])),
+                         str(entry['source']), str(entry['fingerprint'])]))
+    print(f'Total: {sum(entry["size"] for entry in manifest) / (1024 * 1024):.2f} MB')
@@ -0,0 +1,61 @@
+# Copyright 2024 CJVT
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+
+from stark.data.summary import Summary
+from stark.processing.processor import Processor
+
+logger = logging.getLogger('stark')
+
+# settings that only change output, they are turned off while support of trees is counted
+MINING_OUTPUT_SETTINGS = {'example': False, 'detailed_results_file': None, 'sentence_count_file': None,
+                          'annodoc_example_dir': None, 'annodoc_detailed_dir': None, 'grew_match': False,
+                          'depsearch': False, 'association_measures': False, 'continuation_processing': False,
+                          'checkpoint_sentences': 0, 'checkpoint_seconds': 0}
+
+
+def get_frequent_keys(configs, filters, query_trees):
+    """
+    Finds keys of trees whose support (number of nodes in corpus at which tree is rooted) is at least
+    `mining_support`. Trees are counted level by level: trees of each size are only extended from frequent smaller
+    trees, because no tree is more frequent than its parts.
+    :param configs:
+    :param filters:
+    :param query_trees:
+    :return: A set of keys of frequent trees.
+    """
+    frequent_keys = set()
+    mining_configs = dict(configs, **MINING_OUTPUT_SETTINGS)
+    mining_filters = dict(filters, example=False, detailed_results_file=None, sentence_count_file=None,
+                          annodoc=None, association_measures=False)
+    for size in range(1, filters['tree_size_range'][-1] + 1):
+        processor = Processor(mining_configs, dict(mining_filters, tree_size_range=[1, size],
+                                                   mining=(frozenset(frequent_keys), size)))
+        summary = Summary()
+        summary.set_query_trees(query_trees)
+        if os.path.isdir(configs['input_path']):
+            summary = processor.run_dir(summary)
+        else:
+            summary = processor.run(configs['input_path'], summary)
+
+        size_keys = [key for key, tree in summary.representation_trees.items()
+                     if tree['number'] >= configs['mining_support']]
+        logger.info(f'{len(size_keys)} of {len(summary.representation_trees)} trees of size {size} are frequent.')
+        # every larger tree contains a tree of this size, so none of them is frequent
+        if not size_keys:
+            break
+        frequent_keys.update(size_keys)
+    return frozenset(frequent_keys)
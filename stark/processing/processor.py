@@ -13,16 +13,21 @@
 # limitations under the License.
 
 import logging
-import os
 import time
-from pathlib import Path
+from multiprocessing import Pool
 
-from stark.processing.cache import ProcessorCache
+from stark.data.document import Document
+from stark.data.summary import Summary
+from stark.processing.cache import ProcessorCache, SentenceCheckpoint
 from stark.processing.counters import QueryCounter, GreedyCounter
 from stark.processing.document_processor import DocumentProcessor
+from stark.processing.readers import create_reader, find_conllu_files
 
 logger = logging.getLogger('stark')
 
+# number of byte ranges per core, into which a file is split when it is parsed in parallel
+PARALLEL_RANGES_PER_CORE = 4
+
 
 class Processor(object):
     """
@@ -41,34 +46,154 @@ class Processor(object):
         processor_cache = ProcessorCache(self)
         summary = processor_cache.load_cache(summary)
 
-        for path in sorted(Path(self.configs['input_path']).rglob('*.conllu')):
+        paths = find_conllu_files(self.configs['input_path'])
+        if self.configs['parallel_parsing'] and self.filters['cpu_cores'] > 1:
+            return self.run_dir_parallel(paths, summary, processor_cache)
+
+        for path in paths:
             summary = processor_cache.process_trees(path, summary)
 
         return summary
 
-    def run(self, path, summary):
+    def run_dir_parallel(self, paths, summary, processor_cache):
+        """
+        Spreads whole files across a pool of workers. Each file is read and counted by a single worker and results are
+        merged in the order of files, so they are the same as when files are processed one by one.
+        :param paths: Sorted paths to files in directory.
+        :param summary:
+        :param processor_cache:
+        :return:
+        """
+        paths = [path for path in paths if not processor_cache.is_processed(path)]
+        worker_configs = dict(self.configs, cpu_cores=1, parallel_parsing=False)
+        worker_filters = dict(self.filters, cpu_cores=1)
+        with Pool(self.filters['cpu_cores']) as p:
+            for path, summary_data in zip(paths, p.imap(Processor._run_part, [(worker_configs, worker_filters,
+                                                                               str(path), None, summary.query_trees)
+                                                                              for path in paths])):
+                file_summary = Summary.create_summary_from_cache(summary_data)
+                summary.merge(file_summary, self.filters)
+                processor_cache.add_processed(path, summary, file_summary)
+
+        return summary
+
+    def run(self, path, summary, byte_range=None):
         """
         Run processing.
         :param path_list: List of paths to documents that need to be processed.
         :param summary: A collection of datapoints used for result generation.
+        :param byte_range: A pair of start and end byte offsets, when only a part of a file is processed.
         :return:
         summary: A collection of datapoints used for result generation.
         """
+        if self.configs['parallel_parsing'] and self.filters['cpu_cores'] > 1 and byte_range is None:
+            return self.run_parallel(path, summary)
+
         start_exe_time = time.time()
 
-        document_processor = DocumentProcessor(str(path), self)
-        document = document_processor.form_trees(summary, self.configs)
-        logger.info("Trees formed time:")
-        logger.info("--- %s seconds ---" % (time.time() - start_exe_time))
-        if self.configs['greedy_counter']:
-            tree_counter = GreedyCounter(document, summary, self.filters, self.configs)
+        # intermediate results are not stored for parts of files
+        checkpoint = SentenceCheckpoint(self, str(path), summary) \
+            if byte_range is None and SentenceCheckpoint.is_enabled(self.configs) else None
+        if checkpoint is not None:
+            summary = checkpoint.load(summary)
+            # reading continues after the last counted sentence, when its offset is known
+            if checkpoint.offset is not None:
+                byte_range = (checkpoint.offset, None)
+
+        document_processor = DocumentProcessor(str(path), self, byte_range, record_offsets=checkpoint is not None)
+        if self.configs['streaming']:
+            # trees are counted as they are read, they are not kept in memory or stored in cache
+            document = Document(summary.vocabulary)
+            tree_counter = self._create_counter(document, summary, checkpoint)
+            self._count(tree_counter, checkpoint, tree_counter.run_stream,
+                        document_processor.iterate_trees(document, summary, self.configs))
         else:
-            tree_counter = QueryCounter(document, summary, self.filters, self.configs)
-        tree_counter.run()
-        summary.samples.extend(document.sentence_statistics)
+            document = document_processor.form_trees(summary, self.configs)
+            logger.info("Trees formed time:")
+            logger.info("--- %s seconds ---" % (time.time() - start_exe_time))
+            tree_counter = self._create_counter(document, summary, checkpoint)
+            self._count(tree_counter, checkpoint, tree_counter.run)
+        # statistics of skipped sentences are already in summary loaded from checkpoint
+        summary.samples.extend(document.sentence_statistics[tree_counter.skipped_sentences:])
+        if document.corpus is not None:
+            document.corpus.close()
+        if checkpoint is not None:
+            checkpoint.remove()
 
         logger.info(f"{len(summary.representation_trees)} unique trees counted time (execution time):")
         logger.info("Trees counted time (execution time):")
         logger.info("--- %s seconds ---" % (time.time() - start_exe_time))
 
         return summary
+
+    def run_parallel(self, path, summary):
+        """
+        Splits file into byte ranges at sentence boundaries. Each range is read and counted by its own worker and
+        results are merged in the order of ranges, so they are the same as when file is processed at once.
+        :param path:
+        :param summary:
+        :return:
+        """
+        reader = create_reader(str(path), self.configs)
+        if not reader.is_splittable():
+            logger.info(f'Compressed file {path} can not be split, it will be parsed on a single core.')
+            return Processor(dict(self.configs, parallel_parsing=False), self.filters).run(path, summary)
+
+        start_exe_time = time.time()
+        # more ranges than cores, so that workers finishing early take over the remaining ones
+        byte_ranges = reader.split(self.filters['cpu_cores'] * PARALLEL_RANGES_PER_CORE)
+        worker_configs = dict(self.configs, cpu_cores=1)
+        worker_filters = dict(self.filters, cpu_cores=1)
+        with Pool(self.filters['cpu_cores']) as p:
+            for summary_data in p.imap(Processor._run_part, [(worker_configs, worker_filters, str(path), byte_range,
+                                                               summary.query_trees) for byte_range in byte_ranges]):
+                summary.merge(Summary.create_summary_from_cache(summary_data), self.filters)
+
+        logger.info("Trees counted time (execution time):")
+        logger.info("--- %s seconds ---" % (time.time() - start_exe_time))
+        return summary
+
+    @staticmethod
+    def _run_part(input_data):
+        """
+        Processes a part of a file in a worker and returns its results.
+        :param input_data:
+        :return:
+        """
+        configs, filters, path, byte_range, query_trees = input_data
+        summary = Summary()
+        summary.set_query_trees(query_trees)
+        summary = Processor(configs, filters).run(path, summary, byte_range)
+        return summary.get_summary_data()
+
+    @staticmethod
+    def _count(tree_counter, checkpoint, count_function, *args):
+        """
+        Runs counting. When intermediate results are stored, SIGTERM and SIGINT are handled at sentence boundaries.
+        :param tree_counter:
+        :param checkpoint: SentenceCheckpoint or None.
+        :param count_function: Counting method of tree_counter.
+        :param args: Arguments of count_function.
+        :return:
+        """
+        if checkpoint is None:
+            count_function(*args)
+            return
+
+        checkpoint.set_signal_handlers()
+        try:
+            count_function(*args)
+        finally:
+            checkpoint.restore_signal_handlers()
+
+    def _create_counter(self, document, summary, checkpoint=None):
+        """
+        Creates counter that fits configuration.
+        :param document:
+        :param summary:
+        :param checkpoint: SentenceCheckpoint that stores intermediate results.
+        :return:
+        """
+        if self.configs['greedy_counter']:
+            return GreedyCounter(document, summary, self.filters, self.configs, checkpoint)
+        return QueryCounter(document, summary, self.filters, self.configs, checkpoint)
@@ -0,0 +1,364 @@
+# Copyright 2024 CJVT
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bz2
+import gzip
+import logging
+import lzma
+import mmap
+import os
+import re
+from abc import abstractmethod
+from functools import partial
+from pathlib import Path
+
+from pyconll.unit.sentence import Sentence
+
+logger = logging.getLogger('stark')
+
+SENT_ID_PATTERN = re.compile(r'#\s*([^=]+?)\s*=\s*(.+)')
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+CONLLU_PATTERNS = ['*.conllu'] + [f'*.conllu{suffix}' for suffix in COMPRESSED_OPENERS]
+
+
+def find_conllu_files(dir_path):
+    """
+    Returns sorted paths of all (compressed or uncompressed) CoNLL-U files in directory and its subdirectories.
+    :param dir_path:
+    :return:
+    """
+    return sorted(path for pattern in CONLLU_PATTERNS for path in Path(dir_path).rglob(pattern))
+
+
+def create_reader(path, configs, byte_range=None, record_offsets=False):
+    """
+    Creates reader that fits configuration.
+    :param path: Path to CoNLL-U file.
+    :param configs:
+    :param byte_range: A pair of start and end byte offsets, when only a part of a file is read. End may be None, when
+    file is read until the end.
+    :param record_offsets: Whether byte offsets after read sentences are recorded (ie. for continuing processing).
+    :return:
+    """
+    mapped = configs['mmap_corpus']
+    if mapped and Path(path).suffix in COMPRESSED_OPENERS:
+        logger.warning(f'Compressed files cannot be memory mapped, sentences of {path} will be kept in memory.')
+        mapped = False
+
+    if configs['conllu_reader'] == 'native':
+        return NativeReader(path, mapped, byte_range, record_offsets)
+    return PyconllReader(path, mapped, byte_range, record_offsets)
+
+
+class MappedCorpus(object):
+    """
+    Memory mapped view of an uncompressed CoNLL-U file, that reads sentences on demand by their byte spans.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._mmap = None
+        # sentences are usually requested several times in a row (once for each of their subtrees)
+        self._last_span = None
+        self._last_lines = None
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def open(self):
+        """
+        Maps file into memory. Returns None for empty files, as they cannot be mapped.
+        :return:
+        """
+        if self._mmap is None and os.path.getsize(self.path) > 0:
+            self._file = open(self.path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._file = None
+        self._mmap = None
+        self._last_span = None
+        self._last_lines = None
+
+    def read_lines(self, span):
+        """
+        Returns stripped non-empty lines of a sentence.
+        :param span: A pair of start and end byte offsets of a sentence.
+        :return:
+        """
+        if span != self._last_span:
+            lines = self.open()[span[0]:span[1]].decode('utf-8').split('\n')
+            self._last_lines = [line for line in (line.strip() for line in lines) if line]
+            self._last_span = span
+        return self._last_lines
+
+    def read_tokens(self, span):
+        """
+        Returns a list of (form, space_after) pairs of syntactic words in a sentence.
+        :param span:
+        :return:
+        """
+        tokens = []
+        for line in self.read_lines(span):
+            if line[0] == '#':
+                continue
+            fields = line.split('\t')
+            if fields[0].isdigit():
+                tokens.append((fields[1], NativeReader.parse_space_after(fields[9])))
+        return tokens
+
+    def read_conll(self, span):
+        """
+        Returns sentence in CoNLL-U format.
+        :param span:
+        :return:
+        """
+        return '\n'.join(self.read_lines(span))
+
+
+class Reader(object):
+    """
+    A class used for reading CoNLL-U files sentence by sentence.
+    """
+    def __init__(self, path, mapped=False, byte_range=None, record_offsets=False):
+        self.path = path
+        self.corpus = MappedCorpus(path) if mapped else None
+        self.byte_range = byte_range
+        # byte offset after the last sentence yielded by blocks (None, when it is unknown, ie. in compressed files)
+        self.record_offsets = record_offsets
+        self.end_offset = None
+
+    def _open(self):
+        """
+        Opens input in text mode. Compressed files (.gz, .bz2, .xz) are decompressed while they are read.
+        :return:
+        """
+        opener = COMPRESSED_OPENERS.get(Path(self.path).suffix, open)
+        return opener(self.path, 'rt', encoding='utf-8')
+
+    def is_splittable(self):
+        """
+        Returns True when file may be split into byte ranges (compressed files can not be).
+        :return:
+        """
+        return Path(self.path).suffix not in COMPRESSED_OPENERS
+
+    def split(self, parts):
+        """
+        Splits file into (at most) a given number of byte ranges of similar size, that start and end at sentence
+        boundaries (empty lines).
+        :param parts:
+        :return:
+        """
+        size = os.path.getsize(self.path)
+        boundaries = [0]
+        with open(self.path, 'rb') as f:
+            for part in range(1, parts):
+                position = size * part // parts
+                if position <= boundaries[-1]:
+                    continue
+                f.seek(position)
+                # finish current line and move after the next empty line
+                position += len(f.readline())
+                for raw_line in iter(f.readline, b''):
+                    position += len(raw_line)
+                    if not raw_line.strip():
+                        break
+                if boundaries[-1] < position < size:
+                    boundaries.append(position)
+        boundaries.append(size)
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def blocks(self):
+        """
+        Splits input into blocks of non-empty lines that form a sentence. Each block is yielded together with its span
+        of byte offsets in a file, when file is memory mapped (otherwise span is None).
+        :return:
+        """
+        start, end = self.byte_range if self.byte_range is not None else (0, None)
+        if self.corpus is not None:
+            mapped_file = self.corpus.open()
+            if mapped_file is not None:
+                yield from self._binary_blocks(mapped_file, start, end, True)
+            return
+
+        # offsets are only known when file is read in binary mode
+        if self.byte_range is not None or (self.record_offsets and self.is_splittable()):
+            with open(self.path, 'rb') as f:
+                yield from self._binary_blocks(f, start, end, False)
+            return
+
+        with self._open() as f:
+            lines = []
+            for line in f:
+                line = line.strip()
+                if line:
+                    lines.append(line)
+                elif lines:
+                    yield lines, None
+                    lines = []
+
+            if lines:
+                yield lines, None
+
+    def _binary_blocks(self, source, start, end, record_spans):
+        """
+        Splits a part of a file opened in binary mode (or memory mapped file) into blocks of lines and records their
+        byte offsets.
+        :param source: File or memory mapped file.
+        :param start: Offset of the first byte that is read.
+        :param end: Offset after the last byte that is read or None, when source is read until the end.
+        :param record_spans: When False, spans of blocks are not returned.
+        :return:
+        """
+        source.seek(start)
+        lines = []
+        position = block_start = block_end = start
+        while end is None or position < end:
+            raw_line = source.readline()
+            if not raw_line:
+                break
+            line = raw_line.decode('utf-8').strip()
+            if line:
+                if not lines:
+                    block_start = position
+                lines.append(line)
+                block_end = position + len(raw_line)
+            elif lines:
+                self.end_offset = block_end
+                yield lines, (block_start, block_end) if record_spans else None
+                lines = []
+            position += len(raw_line)
+
+        if lines:
+            self.end_offset = block_end
+            yield lines, (block_start, block_end) if record_spans else None
+
+    @abstractmethod
+    def sentences(self):
+        """
+        Yields tuples of sentence id, a list of token rows, a function that returns sentence in CoNLL-U format and a
+        span of sentence in memory mapped file (or None). Token rows only contain syntactic words (multiword tokens and
+        empty nodes are skipped) and have the following form: (id, form, lemma, upos, xpos, feats, head, deprel,
+        space_after).
+        :return:
+        """
+        return
+
+
+class PyconllReader(Reader):
+    """
+    Reader that parses sentences with pyconll.
+    """
+    def __init__(self, *args):
+        super().__init__(*args)
+
+    def sentences(self):
+        for lines, span in self.blocks():
+            sentence = Sentence('\n'.join(lines))
+            token_rows = []
+            for token in sentence:
+                if not token.id.isdigit():
+                    continue
+
+                space_after = token.misc[
+                                  'SpaceAfter'].pop() != 'No' if token.misc is not None and 'SpaceAfter' in token.misc \
+                    else True
+                token_rows.append((int(token.id), token.form, token.lemma, token.upos, token.xpos, token.feats,
+                                   token.head, token.deprel, space_after))
+            yield sentence.id, token_rows, sentence.conll, span
+
+
+class NativeReader(Reader):
+    """
+    Reader that splits token lines by tabs and only parses columns that are used by STARK. It produces the same values
+    as pyconll, without building its object model.
+    """
+    def __init__(self, *args):
+        super().__init__(*args)
+        # parsed feats are shared between tokens with the same feats column (they are only read afterwards)
+        self._feats_cache = {}
+
+    def sentences(self):
+        for lines, span in self.blocks():
+            sentence_id = None
+            token_rows = []
+            for line in lines:
+                if line[0] == '#':
+                    sent_id_match = SENT_ID_PATTERN.match(line)
+                    if sent_id_match and sent_id_match.group(1) == 'sent_id':
+                        sentence_id = sent_id_match.group(2)
+                    continue
+
+                fields = line.split('\t')
+                if len(fields) != 10:
+                    raise ValueError(f'The number of columns per token line must be 10. Invalid token: {line}')
+                if not fields[0].isdigit():
+                    continue
+                token_id, form, lemma, upos, xpos, feats, head, deprel, _, misc = fields
+
+                # underscores in both form and lemma are not considered as empty
+                if form != '_' or lemma != '_':
+                    form = form if form != '_' else None
+                    lemma = lemma if lemma != '_' else None
+                if feats not in self._feats_cache:
+                    self._feats_cache[feats] = NativeReader._parse_feats(feats, line)
+                token_rows.append((int(token_id), form, lemma,
+                                   upos if upos != '_' else None,
+                                   xpos if xpos != '_' else None,
+                                   self._feats_cache[feats],
+                                   head if head != '_' else None,
+                                   deprel if deprel != '_' else None,
+                                   NativeReader.parse_space_after(misc)))
+            yield sentence_id, token_rows, partial('\n'.join, lines), span
+
+    @staticmethod
+    def _parse_feats(feats, line):
+        """
+        Parses feats column into dictionary of sets of values (the same as pyconll).
+        :param feats:
+        :param line: Token line used in error message.
+        :return:
+        """
+        if feats == '_':
+            return {}
+
+        parsed_feats = {}
+        for feat in feats.split('|'):
+            feat_parts = feat.split('=', 1)
+            if len(feat_parts) == 1 or not feat_parts[1]:
+                raise ValueError(f'Error parsing feats "{feats}" properly. Invalid token: {line}')
+            parsed_feats[feat_parts[0]] = set(feat_parts[1].split(','))
+        return parsed_feats
+
+    @staticmethod
+    def parse_space_after(misc):
+        """
+        Returns False when misc column contains SpaceAfter=No.
+        :param misc:
+        :return:
+        """
+        space_after = True
+        if misc != '_':
+            for misc_part in misc.split('|'):
+                if misc_part.startswith('SpaceAfter='):
+                    space_after = misc_part[11:] != 'No'
+        return space_after
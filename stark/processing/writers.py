@@ -29,6 +29,9 @@ import urllib.parse
 import logging
 from tqdm import tqdm
 
+from stark.data.processing.tree import Tree
+from stark.processing.readers import MappedCorpus
+
 here = path.abspath(path.dirname(__file__))
 logging.basicConfig(level=logging.NOTSET)
 logger = logging.getLogger('stark')
@@ -43,11 +46,28 @@ class Writer(object):
         self.other_summary = other_summary
         self.filters = filters
         self.configs = configs
+        self._mapped_corpora = {}
 
     @abstractmethod
     def write(self):
         return
 
+    def get_unigram_names(self):
+        """
+        Returns frequencies of unigrams by their names. Tokens with the same name are counted together.
+        :return:
+        """
+        unigram_names = {}
+        for token_id, number in self.summary.unigrams.items():
+            form, lemma, upos, xpos, deprel, feats = self.summary.vocabulary.get_token(token_id)
+            node = Tree(0, form, lemma, upos, xpos, deprel, None, feats, token_id)
+            name = Tree._generate_key(node, self.filters['create_output_string_functs'], print_lemma=False)[1]
+            if name in unigram_names:
+                unigram_names[name] += number
+            else:
+                unigram_names[name] = number
+        return unigram_names
+
     def lines_generator(self):
         """
         A generator that returns lines in array form, that can be used for further processing.
@@ -56,6 +76,8 @@ class Writer(object):
         other_representation_trees = self.other_summary.representation_trees if self.other_summary else None
         other_corpus_size = self.other_summary.corpus_size if self.other_summary else None
         random_sentence_position = 0
+        # unigrams are counted by tokens, their names are only created here
+        unigrams = self.get_unigram_names() if self.filters['association_measures'] else None
 
         # skip elements that do not fit filters
         if self.filters['frequency_threshold'] or self.filters['display_size_range'][-1]:
@@ -189,7 +211,7 @@ class Writer(object):
                 annodoc_json = json.dumps(annodoc_dict)
                 row += [annodoc_json]
             if self.filters['association_measures']:
-                row += self.get_collocabilities(v, self.summary.unigrams, self.summary.corpus_size)
+                row += self.get_collocabilities(v, unigrams, self.summary.corpus_size)
             if self.configs['compare']:
                 other_abs_freq = other_representation_trees[k]['number'] if k in other_representation_trees else 0
                 row += self.get_keyness(v['number'], other_abs_freq, self.summary.corpus_size, other_corpus_size)
@@ -237,7 +259,23 @@ class Writer(object):
                 if not annodoc_path.exists():
                     with open(annodoc_path, "w", newline="",
                               encoding="utf-8") as wf:
-                        wf.write(s[2][0])
+                        wf.write(self.get_conll(s[2][0]))
+        for mapped_corpus in self._mapped_corpora.values():
+            mapped_corpus.close()
+
+    def get_conll(self, conll):
+        """
+        Returns sentence in CoNLL-U format. Sentences of memory mapped corpora are stored as (path, span) references and
+        are read from files only when they are written.
+        :param conll:
+        :return:
+        """
+        if isinstance(conll, str):
+            return conll
+        path, span = conll
+        if path not in self._mapped_corpora:
+            self._mapped_corpora[path] = MappedCorpus(path)
+        return self._mapped_corpora[path].read_conll(span)
 
     def write_annodoc_detailed_files(self):
         """
@@ -24,6 +24,8 @@ import logging
 
 from stark.data.summary import Summary
 from stark.processing.filters import read_filters
+from stark.processing.cache import ResultCache
+from stark.processing.mining import get_frequent_keys
 from stark.processing.processor import Processor
 from stark.processing.query_trees import generate_query_trees, get_query_tree_size_range
 from stark.processing.writers import TSVWriter, ObjectWriter
@@ -48,6 +50,12 @@ def parse_args(args):
     parser.add_argument("--input", default=None, type=str, help="The input file/folder.")
     parser.add_argument("--output", default=None, type=str, help="The output file.")
     parser.add_argument("--internal_saves", default=None, type=str, help="Location for internal_saves.")
+    parser.add_argument("--cache_compression", default=None, type=int,
+                        help="Compression level of files in internal_saves (0 for no compression).")
+    parser.add_argument("--result_cache_size", default=None, type=int,
+                        help="Size (in MB) of counted results stored in internal_saves (0 disables storing).")
+    parser.add_argument("--internal_saves_size", default=None, type=int,
+                        help="Size (in MB) of caches in internal_saves (least recently used are deleted).")
     parser.add_argument("--cpu_cores", default=None, type=int, help="Number of cores used.")
     parser.add_argument("--greedy_counter", default=None, type=str, help="Uses greedy counter.")
 
@@ -80,11 +88,27 @@ def parse_args(args):
     parser.add_argument("--annodoc_detailed_dir", default=None, type=str,
                         help="Path to a directory where annodoc detailed files are stored (js library for visualization).")
 
+    parser.add_argument("--mining_support", default=None, type=int,
+                        help="Minimal number of nodes at which tree is rooted, that is required for extending it.")
     parser.add_argument("--max_lines", default=None, type=str, help="Maximum number of trees in the output.")
     parser.add_argument("--node_info", default=None, type=str, help="Information about nodes in separate columns.")
     parser.add_argument("--frequency_threshold", default=None, type=int, help="Frequency threshold.")
     parser.add_argument("--association_measures", default=None, type=str, help="Association measures.")
     parser.add_argument("--continuation_processing", default=None, type=str, help="Nodes number.")
+    parser.add_argument("--checkpoint_sentences", default=None, type=int,
+                        help="Number of counted sentences after which intermediate results of a file are stored.")
+    parser.add_argument("--checkpoint_seconds", default=None, type=float,
+                        help="Number of seconds after which intermediate results of a file are stored.")
+    parser.add_argument("--streaming", default=None, type=str,
+                        help="Counts trees sentence by sentence while reading input, without storing them in memory.")
+    parser.add_argument("--conllu_reader", default=None, type=str,
+                        help="Reader used for parsing input files (pyconll or native).")
+    parser.add_argument("--parallel_parsing", default=None, type=str,
+                        help="Splits input file into parts, that are parsed and counted on separate cores.")
+    parser.add_argument("--mmap_corpus", default=None, type=str,
+                        help="Reads example sentences from memory mapped input instead of storing them in memory.")
+    parser.add_argument("--columnar_corpus", default=None, type=str,
+                        help="Stores sentences as compact arrays of attribute ids and creates trees only while counting.")
     parser.add_argument("--compare", default=None, type=str, help="Corpus with which we want to compare statistics.")
     return parser.parse_args(args)
 
@@ -105,12 +129,30 @@ def count_subtrees(configs, filters):
         if configs['greedy_counter']:
             filters['tree_size_range'] = get_query_tree_size_range(summary.query_trees)
 
+    # trees of compared corpus are counted with frequent trees of the first corpus, so that both corpora contain the
+    # same trees (their results depend on both corpora, so they are not stored)
+    compared = filters['mining'] is not None
+    if configs['mining_support'] and configs['compare'] is not None and not compared:
+        filters['mining'] = (get_frequent_keys(configs, filters, summary.query_trees), None)
+
+    result_cache = ResultCache(configs)
+    cached_summary = result_cache.load(configs['input_path']) if not compared else None
+    if cached_summary is not None:
+        return cached_summary
+
+    if configs['mining_support'] and filters['mining'] is None:
+        # only frequent trees are counted
+        processor = Processor(configs, dict(filters, mining=(get_frequent_keys(configs, filters, summary.query_trees),
+                                                             None)))
+
     if os.path.isdir(configs['input_path']):
         summary = processor.run_dir(summary)
 
     else:
         summary = processor.run(configs['input_path'], summary)
 
+    if not compared:
+        result_cache.save(configs['input_path'], summary)
     return summary
 
 
@@ -144,6 +186,12 @@ def read_configs(config, args):
     configs['internal_saves'] = (config.get('settings', 'internal_saves')
                                  if config.has_option('settings', 'internal_saves') else None) \
         if not args.internal_saves else args.internal_saves
+    configs['cache_compression'] = config.getint('settings', 'cache_compression', fallback=1) \
+        if args.cache_compression is None else args.cache_compression
+    configs['result_cache_size'] = config.getint('settings', 'result_cache_size', fallback=0) \
+        if args.result_cache_size is None else args.result_cache_size
+    configs['internal_saves_size'] = config.getint('settings', 'internal_saves_size', fallback=0) \
+        if args.internal_saves_size is None else args.internal_saves_size
     configs['cpu_cores'] = (config.getint('settings', 'cpu_cores') if config.has_option('settings', 'cpu_cores')
                             else 1) if not args.cpu_cores else args.cpu_cores
     configs['complete_tree_type'] = (config.getboolean('settings', 'complete') if not args.complete
@@ -192,9 +240,35 @@ def read_configs(config, args):
         if not args.frequency_threshold else args.frequency_threshold
     configs['lines_threshold'] = config.getint('settings', 'max_lines', fallback=0) \
         if not args.max_lines else args.max_lines
+    configs['mining_support'] = config.getint('settings', 'mining_support', fallback=0) \
+        if not args.mining_support else args.mining_support
+    if configs['mining_support'] and (not configs['greedy_counter'] or configs['complete_tree_type']):
+        raise ValueError('`mining_support` works only with `greedy_counter=yes` and `complete=no`!')
+    if configs['mining_support'] and configs['ignored_labels']:
+        raise ValueError('`mining_support` can not be used together with `ignored_labels`!')
 
     configs['continuation_processing'] = config.getboolean('settings', 'continuation_processing', fallback=False) \
         if not args.continuation_processing else args.continuation_processing == 'yes'
+    configs['checkpoint_sentences'] = config.getint('settings', 'checkpoint_sentences', fallback=0) \
+        if not args.checkpoint_sentences else args.checkpoint_sentences
+    configs['checkpoint_seconds'] = config.getfloat('settings', 'checkpoint_seconds', fallback=0) \
+        if not args.checkpoint_seconds else args.checkpoint_seconds
+
+    configs['streaming'] = config.getboolean('settings', 'streaming', fallback=False) \
+        if not args.streaming else args.streaming == 'yes'
+
+    configs['conllu_reader'] = config.get('settings', 'conllu_reader', fallback='pyconll') \
+        if not args.conllu_reader else args.conllu_reader
+    if configs['conllu_reader'] not in ['pyconll', 'native']:
+        raise ValueError('`conllu_reader` has to be either `pyconll` or `native`!')
+
+    configs['parallel_parsing'] = config.getboolean('settings', 'parallel_parsing', fallback=False) \
+        if not args.parallel_parsing else args.parallel_parsing == 'yes'
+
+    configs['mmap_corpus'] = config.getboolean('settings', 'mmap_corpus', fallback=False) \
+        if not args.mmap_corpus else args.mmap_corpus == 'yes'
+    configs['columnar_corpus'] = config.getboolean('settings', 'columnar_corpus', fallback=False) \
+        if not args.columnar_corpus else args.columnar_corpus == 'yes'
 
     configs['grew_match'] = config.getboolean('settings',
                                               'grew_match') if not args.grew_match else args.grew_match == 'yes'
@@ -15,19 +15,91 @@
 import gzip
 import pickle
 import re
+import zlib
 from pathlib import Path
 
+# first bytes of gzip files
+GZIP_MAGIC = b'\x1f\x8b'
+# number of bytes that are read at once from files of consecutive pickles
+PICKLES_CHUNK_SIZE = 1024 * 1024
+
+
+def save_zipped_pickle(obj, filename, protocol=pickle.HIGHEST_PROTOCOL, compresslevel=9):
+    """
+    Stores object in a gzip compressed pickle.
+    :param obj:
+    :param filename:
+    :param protocol:
+    :param compresslevel: Gzip compression level (when 0, pickle is stored without compression).
+    :return:
+    """
+    Path(filename).parent.mkdir(parents=True, exist_ok=True)
+    data = pickle.dumps(obj, protocol)
+    if compresslevel > 0:
+        data = gzip.compress(data, compresslevel)
+    with open(filename, 'wb') as f:
+        f.write(data)
+
 
-def save_zipped_pickle(obj, filename, protocol=-1):
+def load_zipped_pickle(filename):
+    """
+    Loads object stored by save_zipped_pickle. Whole file is decompressed at once, which is much faster than reading
+    pickle from gzip stream.
+    :param filename:
+    :return:
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    return pickle.loads(data)
+
+
+def append_zipped_pickle(obj, filename, protocol=pickle.HIGHEST_PROTOCOL, compresslevel=9):
+    """
+    Appends object to a file of consecutive pickles (each of them is stored as a separate gzip member).
+    :param obj:
+    :param filename:
+    :param protocol:
+    :param compresslevel: Gzip compression level (0 stores members without compression).
+    :return:
+    """
     Path(filename).parent.mkdir(parents=True, exist_ok=True)
-    with gzip.open(filename, 'wb') as f:
+    with gzip.open(filename, 'ab', compresslevel) as f:
         pickle.dump(obj, f, protocol)
 
 
-def load_zipped_pickle(filename):
-    with gzip.open(filename, 'rb') as f:
-        loaded_object = pickle.load(f)
-        return loaded_object
+def load_zipped_pickles(filename):
+    """
+    Yields objects from a file written by append_zipped_pickle, together with offsets in file where they end. Reading
+    stops at the first incomplete or corrupted object (ie. when writing was interrupted), so that file may be
+    truncated to the end of the last complete object.
+    :param filename:
+    :return:
+    """
+    with open(filename, 'rb') as f:
+        end, data = 0, b''
+        while True:
+            # each object is stored in its own gzip member
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            parts, member_size = [], 0
+            while not decompressor.eof:
+                if not data:
+                    data = f.read(PICKLES_CHUNK_SIZE)
+                    if not data:
+                        return
+                try:
+                    parts.append(decompressor.decompress(data))
+                except zlib.error:
+                    return
+                member_size += len(data) - len(decompressor.unused_data)
+                data = decompressor.unused_data
+            try:
+                obj = pickle.loads(b''.join(parts))
+            except (EOFError, pickle.UnpicklingError):
+                return
+            end += member_size
+            yield obj, end
 
 
 def printable_answers(query):
@@ -74,4 +146,4 @@ def create_output_string_none(tree):
 
 
 def create_output_string_feats(tree):
-    return '|'.join([f'{k}={list(v.keys())[0]}' for k, v in tree.feats_detailed.items()])
+    return tree.feats.string
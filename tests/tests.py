@@ -1,11 +1,27 @@
 import filecmp
+import gzip
+import itertools
+import json
+import lzma
 import os
+import pickle
 import random
 import shutil
+import signal
+import subprocess
+import sys
+import time
 
 import pytest
 import stark
-from stark.stark import read_settings, parse_args
+from stark.data.feature_bundle import FeatureBundle
+from stark.data.representation.greedy_tree import GreedyRepresentationTree
+from stark.data.representation.subtree_keys import SubtreeKeys
+from stark.processing import cache, counters, internal_saves
+from stark.processing.filters import Filter, read_filters
+from stark.processing.processor import Processor
+from stark.stark import read_settings, parse_args, count_subtrees
+from stark.utils import append_zipped_pickle, load_zipped_pickle, load_zipped_pickles
 from tests import *
 
 
@@ -93,6 +109,200 @@ def test_fixed():
     assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_fixed.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_fixed.tsv'))
 
 
+def test_streaming():
+    """
+    Test counting trees while reading input.
+    :return:
+    """
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    settings = read_settings(config_file, parse_args(['--streaming', 'yes']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_base.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_base.tsv'))
+
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_output_settings.ini')
+    settings = read_settings(config_file, parse_args(['--detailed_results_file',
+                                                      'test_data/output/detailed_results_file_greedy.tsv',
+                                                      '--sentence_count_file',
+                                                      'test_data/output/sentence_count_file_greedy.tsv',
+                                                      '--greedy_counter', 'yes',
+                                                      '--streaming', 'yes',
+                                                      '--cpu_cores', '2']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_output_settings.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'out_output_settings.tsv'))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'detailed_results_file_greedy.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                           'detailed_results_file_greedy.tsv'))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'sentence_count_file_greedy.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'sentence_count_file_greedy.tsv'))
+
+
+def test_streaming_statistics():
+    """
+    Test that statistics of streamed sentences are only kept when counts of trees in sentences are written.
+    :return:
+    """
+    config_file = os.path.join(CONFIGS_DIR, 'config_output_settings.ini')
+    settings = read_settings(config_file, parse_args(['--streaming', 'yes']))
+    settings['sentence_count_file'] = None
+    random.seed(12)
+    assert count_subtrees(settings, read_filters(settings)).samples == []
+
+    # sentence counts are also written, when processing continues after intermediate results were stored
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    settings = read_settings(config_file, parse_args(['--streaming', 'yes',
+                                                      '--internal_saves', output_mapper_dir,
+                                                      '--continuation_processing', 'yes',
+                                                      '--checkpoint_sentences', '50']))
+    interrupt_after_checkpoint(settings)
+    random.seed(12)
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_output_settings.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'out_output_settings.tsv'))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'sentence_count_file.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'sentence_count_file.tsv'))
+
+
+@pytest.mark.parametrize('greedy_counter,streaming,fixed', [('no', 'no', 'yes'), ('yes', 'no', 'yes'),
+                                                             ('yes', 'yes', 'yes'), ('yes', 'no', 'no')])
+def test_multiprocessing_example(greedy_counter, streaming, fixed):
+    """
+    Test that results with examples counted on multiple cores are the same as when counted on a single core.
+    :return:
+    """
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    for cpu_cores in ['1', '2']:
+        random.seed(12)
+        settings = read_settings(config_file, parse_args(['--example', 'yes',
+                                                          '--greedy_counter', greedy_counter,
+                                                          '--streaming', streaming,
+                                                          '--fixed', fixed,
+                                                          '--cpu_cores', cpu_cores,
+                                                          '--output',
+                                                          f'test_data/output/out_example_{cpu_cores}.tsv']))
+        stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_example_1.tsv'), os.path.join(OUTPUT_DIR, 'out_example_2.tsv'),
+                       shallow=False)
+
+
+def test_native_reader():
+    """
+    Test native CoNLL-U reader.
+    :return:
+    """
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    settings = read_settings(config_file, parse_args(['--conllu_reader', 'native']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_base.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_base.tsv'))
+
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_query.ini')
+    settings = read_settings(config_file, parse_args(['--greedy_counter', 'yes', '--conllu_reader', 'native']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_query.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_query.tsv'))
+
+
+def test_mmap_corpus():
+    """
+    Test reading examples from memory mapped input.
+    :return:
+    """
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_query.ini')
+    settings = read_settings(config_file, parse_args(['--mmap_corpus', 'yes']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_query.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_query.tsv'))
+
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_output_settings.ini')
+    settings = read_settings(config_file, parse_args(['--detailed_results_file',
+                                                      'test_data/output/detailed_results_file_query.tsv',
+                                                      '--mmap_corpus', 'yes',
+                                                      '--conllu_reader', 'native']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_output_settings.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'out_output_settings.tsv'))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'detailed_results_file_query.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                           'detailed_results_file_query.tsv'))
+
+
+def test_parallel_parsing():
+    """
+    Test splitting input file into parts that are processed on separate cores.
+    :return:
+    """
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_query.ini')
+    settings = read_settings(config_file, parse_args(['--parallel_parsing', 'yes', '--cpu_cores', '3']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_query.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_query.tsv'))
+
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_output_settings.ini')
+    settings = read_settings(config_file, parse_args(['--detailed_results_file',
+                                                      'test_data/output/detailed_results_file_greedy.tsv',
+                                                      '--sentence_count_file',
+                                                      'test_data/output/sentence_count_file_greedy.tsv',
+                                                      '--greedy_counter', 'yes',
+                                                      '--parallel_parsing', 'yes',
+                                                      '--mmap_corpus', 'yes',
+                                                      '--cpu_cores', '3']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_output_settings.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'out_output_settings.tsv'))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'detailed_results_file_greedy.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                           'detailed_results_file_greedy.tsv'))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'sentence_count_file_greedy.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'sentence_count_file_greedy.tsv'))
+
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    settings = read_settings(config_file, parse_args(['--input', 'test_data/input/dir_input/',
+                                                      '--output', 'test_data/output/out_dir.tsv',
+                                                      '--internal_saves', output_mapper_dir,
+                                                      '--continuation_processing', 'yes',
+                                                      '--parallel_parsing', 'yes',
+                                                      '--cpu_cores', '2']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_dir.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_dir.tsv'))
+
+
+def test_columnar_corpus():
+    """
+    Test storing sentences in columnar form and creating their trees while counting.
+    :return:
+    """
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_query.ini')
+    settings = read_settings(config_file, parse_args(['--columnar_corpus', 'yes']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_query.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_query.tsv'))
+
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_output_settings.ini')
+    settings = read_settings(config_file, parse_args(['--detailed_results_file',
+                                                      'test_data/output/detailed_results_file_greedy.tsv',
+                                                      '--sentence_count_file',
+                                                      'test_data/output/sentence_count_file_greedy.tsv',
+                                                      '--greedy_counter', 'yes',
+                                                      '--columnar_corpus', 'yes',
+                                                      '--cpu_cores', '3']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_output_settings.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'out_output_settings.tsv'))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'detailed_results_file_greedy.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                           'detailed_results_file_greedy.tsv'))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'sentence_count_file_greedy.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'sentence_count_file_greedy.tsv'))
+
+
 def test_dir():
     """
     Test complete=no and query.
@@ -113,6 +323,263 @@ def test_dir():
     assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_dir.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_dir.tsv'))
 
 
+def test_dir_internal_storage():
+    """
+    Test storing trees of each file in a directory and loading them in the next run.
+    :return:
+    """
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    output_mapper_dir = 'test_data/output/internal_saves'
+    for extra_args in [[], ['--columnar_corpus', 'yes', '--greedy_counter', 'yes']]:
+        if os.path.exists(output_mapper_dir):
+            shutil.rmtree(output_mapper_dir)
+        settings = read_settings(config_file, parse_args(['--input', 'test_data/input/dir_input/',
+                                                          '--output', 'test_data/output/out_dir.tsv',
+                                                          '--internal_saves', output_mapper_dir] + extra_args))
+        for _ in range(2):
+            random.seed(12)
+            stark.run(settings)
+            assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_dir.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_dir.tsv'))
+        # trees of both files are stored next to checkpoint and manifest
+        assert len(os.listdir(output_mapper_dir)) == 4
+
+
+@pytest.mark.parametrize('min_journal_compaction_size', [0, cache.MIN_JOURNAL_COMPACTION_SIZE])
+def test_continuation_journal(min_journal_compaction_size):
+    """
+    Test continuing processing from journal of processed files (with and without compaction into snapshot).
+    :return:
+    """
+    default_min_journal_compaction_size = cache.MIN_JOURNAL_COMPACTION_SIZE
+    cache.MIN_JOURNAL_COMPACTION_SIZE = min_journal_compaction_size
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    settings = read_settings(config_file, parse_args(['--input', 'test_data/input/dir_input/',
+                                                      '--output', 'test_data/output/out_dir.tsv',
+                                                      '--internal_saves', output_mapper_dir,
+                                                      '--continuation_processing', 'yes']))
+    try:
+        random.seed(12)
+        stark.run(settings)
+        # small journals are only compacted into snapshot when minimal compaction size is 0
+        assert os.path.exists(os.path.join(output_mapper_dir, 'checkpoint.pkl')) == (min_journal_compaction_size == 0)
+
+        # all files are skipped and their results are loaded from checkpoint
+        os.remove(os.path.join(OUTPUT_DIR, 'out_dir.tsv'))
+        random.seed(12)
+        stark.run(settings)
+        assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_dir.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_dir.tsv'))
+    finally:
+        cache.MIN_JOURNAL_COMPACTION_SIZE = default_min_journal_compaction_size
+
+
+def test_truncated_journal():
+    """
+    Test continuing processing after writing to journal of processed files was interrupted.
+    :return:
+    """
+    journal_path = os.path.join(OUTPUT_DIR, 'journal.pkl')
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+    for obj in ['a', 'b']:
+        append_zipped_pickle(obj, journal_path)
+    with open(journal_path, 'rb') as rf:
+        journal = rf.read()
+    first_end = next(load_zipped_pickles(journal_path))[1]
+    for size in range(len(journal)):
+        with open(journal_path, 'wb') as wf:
+            wf.write(journal[:size])
+        assert [obj for obj, _ in load_zipped_pickles(journal_path)] == (['a'] if size >= first_end else [])
+
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    settings = read_settings(config_file, parse_args(['--input', 'test_data/input/dir_input/',
+                                                      '--output', 'test_data/output/out_dir.tsv',
+                                                      '--internal_saves', output_mapper_dir,
+                                                      '--continuation_processing', 'yes']))
+    random.seed(12)
+    stark.run(settings)
+    journal_path = os.path.join(output_mapper_dir, 'checkpoint_journal.pkl')
+    os.truncate(journal_path, os.path.getsize(journal_path) - 100)
+
+    # results of the second file are counted again and appended after the complete results of the first one
+    for _ in range(2):
+        os.remove(os.path.join(OUTPUT_DIR, 'out_dir.tsv'))
+        random.seed(12)
+        stark.run(settings)
+        assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_dir.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_dir.tsv'))
+        assert len(list(load_zipped_pickles(journal_path))) == 2
+
+
+def interrupt_after_checkpoint(settings):
+    """
+    Runs processing, that is interrupted once the first intermediate results are stored.
+    :param settings:
+    :return:
+    """
+    class Interrupted(Exception):
+        pass
+
+    def interrupting_save(self, summary):
+        default_save(self, summary)
+        raise Interrupted
+
+    default_save = cache.SentenceCheckpoint.save
+    cache.SentenceCheckpoint.save = interrupting_save
+    try:
+        random.seed(12)
+        with pytest.raises(Interrupted):
+            stark.run(settings)
+    finally:
+        cache.SentenceCheckpoint.save = default_save
+
+
+@pytest.mark.parametrize('streaming,cpu_cores,compressed', [('no', '1', False), ('yes', '1', False),
+                                                            ('yes', '2', False), ('no', '1', True)])
+def test_sentence_checkpoint(streaming, cpu_cores, compressed):
+    """
+    Test continuing processing of a file after the last stored sentence.
+    :return:
+    """
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    input_path = os.path.join(INPUT_DIR, 'sl_ssj-ud-dev.conllu')
+    if compressed:
+        with open(input_path, 'rb') as rf, gzip.open(os.path.join(OUTPUT_DIR, 'sl_ssj-ud-dev.conllu.gz'), 'wb') as wf:
+            shutil.copyfileobj(rf, wf)
+        input_path = os.path.join(OUTPUT_DIR, 'sl_ssj-ud-dev.conllu.gz')
+    settings = read_settings(config_file, parse_args(['--input', input_path,
+                                                      '--internal_saves', output_mapper_dir,
+                                                      '--continuation_processing', 'yes',
+                                                      '--checkpoint_sentences', '50',
+                                                      '--streaming', streaming,
+                                                      '--cpu_cores', cpu_cores]))
+    interrupt_after_checkpoint(settings)
+    checkpoint_name = next(file_name for file_name in os.listdir(output_mapper_dir)
+                           if file_name.endswith('_sentences.pkl'))
+    _, counted_sentences, offset, _, _ = load_zipped_pickle(os.path.join(output_mapper_dir, checkpoint_name))
+    # uncompressed file is read again after the last counted sentence
+    if compressed:
+        assert offset is None
+    else:
+        with open(input_path, 'rb') as rf:
+            assert rf.read()[:offset].count(b'# sent_id') == counted_sentences
+
+    # counted sentences are loaded from checkpoint, which is deleted once the whole file is processed
+    if os.path.exists(os.path.join(OUTPUT_DIR, 'out_base.tsv')):
+        os.remove(os.path.join(OUTPUT_DIR, 'out_base.tsv'))
+    random.seed(12)
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_base.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_base.tsv'))
+    assert not any(file_name.endswith('_sentences.pkl') for file_name in os.listdir(output_mapper_dir))
+
+
+def test_sentence_checkpoint_settings():
+    """
+    Test that intermediate results are not used when settings that affect counting change.
+    :return:
+    """
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    args = ['--internal_saves', output_mapper_dir, '--continuation_processing', 'yes', '--checkpoint_sentences', '50']
+    interrupt_after_checkpoint(read_settings(config_file, parse_args(args)))
+
+    random.seed(12)
+    stark.run(read_settings(config_file, parse_args(args + ['--fixed', 'no',
+                                                            '--output', 'test_data/output/out_fixed.tsv'])))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_fixed.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_fixed.tsv'))
+    assert not any(file_name.endswith('_sentences.pkl') for file_name in os.listdir(output_mapper_dir))
+
+
+@pytest.mark.skipif(not hasattr(os, 'killpg'), reason='process groups are not supported')
+@pytest.mark.parametrize('signum', [signal.SIGINT, signal.SIGTERM])
+def test_sentence_checkpoint_signal(signum):
+    """
+    Test storing results when a multi-core run receives a signal (ie. Ctrl+C in terminal, that is sent to workers
+    too) and continuing processing after it.
+    :return:
+    """
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    args = ['--internal_saves', output_mapper_dir, '--continuation_processing', 'yes', '--checkpoint_sentences', '50',
+            '--cpu_cores', '2']
+    # workers are slowed down, so that signal is received while they are counting
+    script = f"""
+import time
+import stark
+from stark.processing import counters
+from stark.stark import read_settings, parse_args
+
+def slow_count_sentences(task, count_sentences=counters._count_sentences):
+    time.sleep(1)
+    return count_sentences(task)
+
+counters._count_sentences = slow_count_sentences
+stark.run(read_settings({config_file!r}, parse_args({args!r})))
+"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(stark.__file__)))] +
+        ([os.environ['PYTHONPATH']] if 'PYTHONPATH' in os.environ else [])))
+    process = subprocess.Popen([sys.executable, '-c', script], env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while not (os.path.exists(output_mapper_dir) and
+                   any(file_name.endswith('_sentences.pkl') for file_name in os.listdir(output_mapper_dir))):
+            assert process.poll() is None
+            time.sleep(0.05)
+        os.killpg(process.pid, signum)
+        assert process.wait(timeout=60) != 0
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+    assert any(file_name.endswith('_sentences.pkl') for file_name in os.listdir(output_mapper_dir))
+
+    if os.path.exists(os.path.join(OUTPUT_DIR, 'out_base.tsv')):
+        os.remove(os.path.join(OUTPUT_DIR, 'out_base.tsv'))
+    random.seed(12)
+    stark.run(read_settings(config_file, parse_args(args)))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_base.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_base.tsv'))
+    assert not any(file_name.endswith('_sentences.pkl') for file_name in os.listdir(output_mapper_dir))
+
+
+def test_compressed_input():
+    """
+    Test compressed input files and directories.
+    :return:
+    """
+    compressed_dir = os.path.join(OUTPUT_DIR, 'compressed_input')
+    if os.path.exists(compressed_dir):
+        shutil.rmtree(compressed_dir)
+    os.makedirs(compressed_dir)
+    for file_name, opener in [('en_ewt-ud-dev.conllu.gz', gzip.open), ('sl_ssj-ud-dev.conllu.xz', lzma.open)]:
+        with open(os.path.join(INPUT_DIR, 'dir_input', file_name.rsplit('.', 1)[0]), 'rb') as rf, \
+                opener(os.path.join(compressed_dir, file_name), 'wb') as wf:
+            shutil.copyfileobj(rf, wf)
+
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    settings = read_settings(config_file, parse_args(['--input', os.path.join(compressed_dir, 'sl_ssj-ud-dev.conllu.xz'),
+                                                      '--conllu_reader', 'native']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_base.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_base.tsv'))
+
+    random.seed(12)
+    settings = read_settings(config_file, parse_args(['--input', compressed_dir,
+                                                      '--output', 'test_data/output/out_dir.tsv']))
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_dir.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_dir.tsv'))
+
+
 def test_internal_storage():
     """
     Test internal storage.
@@ -168,6 +635,178 @@ def test_internal_storage2():
                                                                                            'out_internal_storage2.tsv'))
 
 
+def test_cache_compression():
+    """
+    Test internal storage without compression.
+    :return:
+    """
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    settings = read_settings(config_file, parse_args(['--internal_saves', 'test_data/output/internal_saves',
+                                                      '--output', 'test_data/output/out_internal_storage2.tsv',
+                                                      '--greedy_counter', 'yes',
+                                                      '--cache_compression', '0']))
+    stark.run(settings)
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_internal_storage2.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                           'out_internal_storage2.tsv'))
+    for file_name in os.listdir(output_mapper_dir):
+        with open(os.path.join(output_mapper_dir, file_name), 'rb') as f:
+            assert f.read(2) != b'\x1f\x8b'
+
+
+def test_result_cache():
+    """
+    Test that results of repeated runs are loaded from internal storage.
+    :return:
+    """
+    def failing_run(self, path, summary, byte_range=None):
+        raise AssertionError('Results should be loaded from cache.')
+
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    results_dir = os.path.join(output_mapper_dir, 'results')
+    os.makedirs(results_dir)
+    # results that were not used for the longest time are deleted when cache grows too large
+    old_result = os.path.join(results_dir, 'old_result')
+    with open(old_result, 'wb') as f:
+        f.write(bytes(2 * 1024 * 1024))
+    os.utime(old_result, (0, 0))
+
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    settings = read_settings(config_file, parse_args(['--internal_saves', output_mapper_dir,
+                                                      '--result_cache_size', '2',
+                                                      '--output', 'test_data/output/out_result_cache.tsv']))
+    random.seed(12)
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_result_cache.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                      'out_base.tsv'))
+    assert not os.path.exists(old_result)
+    assert len(os.listdir(results_dir)) == 1
+
+    default_run = Processor.run
+    Processor.run = failing_run
+    try:
+        os.remove(os.path.join(OUTPUT_DIR, 'out_result_cache.tsv'))
+        random.seed(12)
+        stark.run(settings)
+        assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_result_cache.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                          'out_base.tsv'))
+    finally:
+        Processor.run = default_run
+
+    # results of different settings are stored separately
+    random.seed(12)
+    stark.run(read_settings(config_file, parse_args(['--internal_saves', output_mapper_dir,
+                                                     '--result_cache_size', '2',
+                                                     '--output', 'test_data/output/out_result_cache.tsv',
+                                                     '--greedy_counter', 'yes'])))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_result_cache.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                      'out_base.tsv'))
+    assert len(os.listdir(results_dir)) == 2
+
+
+def test_result_cache_output_files():
+    """
+    Test that results counted without sentences are not reused when detailed results or sentence counts are needed.
+    :return:
+    """
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    config_file = os.path.join(CONFIGS_DIR, 'config_output_settings.ini')
+    arguments = ['--internal_saves', output_mapper_dir, '--result_cache_size', '10']
+
+    random.seed(12)
+    settings = read_settings(config_file, parse_args(arguments))
+    settings['detailed_results_file'] = None
+    settings['sentence_count_file'] = None
+    stark.run(settings)
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_output_settings.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'out_output_settings.tsv'))
+
+    random.seed(12)
+    stark.run(read_settings(config_file, parse_args(arguments + ['--detailed_results_file',
+                                                                 'test_data/output/detailed_results_file_query.tsv'])))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'detailed_results_file_query.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                           'detailed_results_file_query.tsv'))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'sentence_count_file.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
+                                                                                         'sentence_count_file.tsv'))
+    assert len(os.listdir(os.path.join(output_mapper_dir, 'results'))) == 2
+
+
+def test_internal_saves_manager(capsys):
+    """
+    Test manifest of internal storage, its size limit and pruning.
+    :return:
+    """
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    args = ['--input', 'test_data/input/dir_input/', '--output', 'test_data/output/out_dir.tsv',
+            '--internal_saves', output_mapper_dir]
+    random.seed(12)
+    stark.run(read_settings(config_file, parse_args(args)))
+    manifest = internal_saves.InternalSaves(output_mapper_dir).read_manifest()
+    assert sorted(entry['kind'] for entry in manifest.values()) == ['checkpoint', 'trees', 'trees']
+    assert sorted(os.path.basename(entry['source']) for entry in manifest.values() if entry['kind'] == 'trees') == \
+        ['en_ewt-ud-dev.conllu', 'sl_ssj-ud-dev.conllu']
+
+    internal_saves.main(['list', output_mapper_dir])
+    assert 'en_ewt-ud-dev.conllu' in capsys.readouterr().out
+
+    # only caches are pruned
+    internal_saves.main(['prune', output_mapper_dir])
+    manifest = internal_saves.InternalSaves(output_mapper_dir).read_manifest()
+    assert [entry['kind'] for entry in manifest.values()] == ['checkpoint']
+
+    # trees of the first file are deleted, when trees of both do not fit into 2 MB
+    random.seed(12)
+    stark.run(read_settings(config_file, parse_args(args + ['--internal_saves_size', '2',
+                                                            '--cache_compression', '0'])))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_dir.tsv'), os.path.join(CORRECT_OUTPUT_DIR, 'out_dir.tsv'))
+    manifest = internal_saves.InternalSaves(output_mapper_dir).read_manifest()
+    assert [os.path.basename(entry['source']) for entry in manifest.values() if entry['kind'] == 'trees'] == \
+        ['sl_ssj-ud-dev.conllu']
+
+
+def test_internal_storage_invalidation():
+    """
+    Test that cached trees are created again when input file or settings change.
+    :return:
+    """
+    output_mapper_dir = 'test_data/output/internal_saves'
+    if os.path.exists(output_mapper_dir):
+        shutil.rmtree(output_mapper_dir)
+    input_path = os.path.join(OUTPUT_DIR, 'changed_input.conllu')
+    shutil.copyfile(os.path.join(INPUT_DIR, 'dir_input', 'en_ewt-ud-dev.conllu'), input_path)
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    args = ['--input', input_path, '--internal_saves', output_mapper_dir,
+            '--output', 'test_data/output/out_internal_storage_invalidation.tsv']
+    random.seed(12)
+    stark.run(read_settings(config_file, parse_args(args)))
+
+    # input file is replaced with a different one under the same name
+    shutil.copyfile(os.path.join(INPUT_DIR, 'sl_ssj-ud-dev.conllu'), input_path)
+    random.seed(12)
+    stark.run(read_settings(config_file, parse_args(args)))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_internal_storage_invalidation.tsv'),
+                       os.path.join(CORRECT_OUTPUT_DIR, 'out_base.tsv'))
+
+    # cache of query trees is not used by greedy counter
+    random.seed(12)
+    stark.run(read_settings(config_file, parse_args(args + ['--greedy_counter', 'yes'])))
+    assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'out_internal_storage_invalidation.tsv'),
+                       os.path.join(CORRECT_OUTPUT_DIR, 'out_base.tsv'))
+    # trees of both settings are stored next to manifest
+    assert len(os.listdir(output_mapper_dir)) == 3
+
+
 def test_output_settings():
     """
     Test complete=no and query.
@@ -198,3 +837,184 @@ def test_output_settings():
                                                                                            'detailed_results_file_greedy.tsv'))
     assert filecmp.cmp(os.path.join(OUTPUT_DIR, 'sentence_count_file_greedy.tsv'), os.path.join(CORRECT_OUTPUT_DIR,
                                                                                          'sentence_count_file_greedy.tsv'))
+
+
+def test_annodoc_positions():
+    """
+    Test that positions of subtrees in annodoc files are not changed when example sentences are recreated.
+    :return:
+    """
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    annodoc_dir = os.path.join(OUTPUT_DIR, 'annodoc_detailed')
+    annodoc_example_dir = os.path.join(OUTPUT_DIR, 'annodoc_example')
+    settings = read_settings(config_file, parse_args(['--greedy_counter', 'yes', '--size', '2-4', '--processing_size',
+                                                      '2-4', '--ignored_labels', 'case', '--detailed_results_file',
+                                                      'test_data/output/detailed_results_file_annodoc.tsv',
+                                                      '--annodoc_example_dir', annodoc_example_dir,
+                                                      '--annodoc_detailed_dir', annodoc_dir]))
+    stark.run(settings)
+    positions = []
+    for file_name in os.listdir(annodoc_dir):
+        with open(os.path.join(annodoc_dir, file_name), 'r', encoding='utf-8') as f:
+            positions.extend(json.loads(line.split('\t')[1]) for line in f)
+    assert positions and all(0 < position < 10000 for subtree_positions in positions for position in subtree_positions)
+
+
+def test_mining_support():
+    """
+    Test that mining returns exactly those trees that are rooted at enough nodes, with the same frequencies.
+    :return:
+    """
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    with pytest.raises(ValueError):
+        read_settings(config_file, parse_args(['--greedy_counter', 'yes', '--complete', 'no', '--mining_support',
+                                               '20']))
+
+    def count(mining_support, **output_settings):
+        random.seed(12)
+        settings = read_settings(config_file, parse_args(['--greedy_counter', 'yes', '--complete', 'no', '--size',
+                                                          '2-4', '--processing_size', '2-4']))
+        settings.update(output=None, ignored_labels=[], mining_support=mining_support, **output_settings)
+        return count_subtrees(settings, read_filters(settings)).representation_trees
+
+    # detailed results store positions of nodes of all occurrences of trees (files are not written)
+    all_trees = count(0, detailed_results_file='unused', annodoc_example_dir='unused')
+    frequent_trees = count(20)
+
+    heads = {}
+    with open(os.path.join(INPUT_DIR, 'sl_ssj-ud-dev.conllu'), encoding='utf-8') as rf:
+        for line in rf:
+            if line.startswith('# sent_id = '):
+                sentence_id = line.split('=', 1)[1].strip()
+                heads[sentence_id] = {}
+            elif line.strip() and not line.startswith('#'):
+                columns = line.split('\t')
+                heads[sentence_id][int(columns[0])] = int(columns[6])
+    # support of tree is the number of distinct nodes its occurrences are rooted at
+    support = {key: len({(sentence_id, next(position for position in positions
+                                             if heads[sentence_id][position] not in positions))
+                         for sentence_id, _, (_, positions), _ in tree['sentence']})
+               for key, tree in all_trees.items()}
+
+    assert set(frequent_trees) == {key for key, number in support.items() if number >= 20}
+    assert all(tree['number'] == all_trees[key]['number'] for key, tree in frequent_trees.items())
+    # some trees occur often enough, but are rooted at too few nodes
+    assert any(tree['number'] >= 20 and key not in frequent_trees for key, tree in all_trees.items())
+
+
+def test_mining_support_compare():
+    """
+    Test that trees of compared corpus are counted for trees that are frequent in the first corpus.
+    :return:
+    """
+    def count(mining_support):
+        random.seed(12)
+        settings = read_settings(os.path.join(CONFIGS_DIR, 'config_compare.ini'),
+                                 parse_args(['--greedy_counter', 'yes', '--complete', 'no']))
+        settings['output'] = None
+        settings['mining_support'] = mining_support
+        header, *rows = stark.run(settings)
+        return {row[0] + row[header.index('Order')]: row for row in rows}
+
+    all_trees = count(0)
+    frequent_trees = count(100)
+    assert 0 < len(frequent_trees) < len(all_trees)
+    # frequencies in compared corpus and statistics are the same as without mining
+    assert all(row == all_trees[key] for key, row in frequent_trees.items())
+
+
+def test_perfect_matching():
+    """
+    Test pairing of children with query children against all permutations on small random bipartite graphs.
+    :return:
+    """
+    rng = random.Random(12)
+    for n in range(1, 7):
+        for _ in range(300):
+            density = rng.choice([0.3, 0.5, 0.8])
+            matches = [[rng.random() < density for _ in range(n)] for _ in range(n)]
+            # children with the same label match the same query children
+            for i in range(1, n):
+                if rng.random() < 0.3:
+                    matches[i] = list(matches[rng.randrange(i)])
+            expected = any(all(matches[i][j] for i, j in enumerate(permutation))
+                           for permutation in itertools.permutations(range(n)))
+            assert bool(GreedyRepresentationTree._has_perfect_matching(matches)) == expected
+
+
+@pytest.mark.parametrize('greedy_counter,fixed', [('no', 'yes'), ('yes', 'yes'), ('yes', 'no')])
+def test_subtree_keys(greedy_counter, fixed):
+    """
+    Test that ids of subtree codes belong to exactly one rendered key and that they are not shared between processes.
+    :return:
+    """
+    subtree_keys = SubtreeKeys()
+    noun_id = subtree_keys.get_id('NOUN', ())
+    adj_id = subtree_keys.get_id('ADJ', ())
+    amod_id = subtree_keys.get_id('NOUN', ((adj_id, 'amod', True),))
+    assert len({noun_id, adj_id, amod_id}) == 3
+    assert subtree_keys.get_id('NOUN', ((adj_id, 'amod', True),)) == amod_id
+    assert subtree_keys.get_id('NOUN', ()) == noun_id
+    assert len(subtree_keys) == 3
+    # ids are local to process, so a copy sent to worker starts empty and assigns its own ids
+    worker_subtree_keys = pickle.loads(pickle.dumps(subtree_keys))
+    assert len(worker_subtree_keys) == 0
+    assert worker_subtree_keys.get_id('ADJ', ()) == noun_id
+
+    key_ids = {}
+    summary_keys = {}
+
+    def recording_postprocess_query_results(self, r, sentence):
+        # trees render their own keys, without table of ids
+        key_ids.setdefault(r.get_key_id(self.filters), set()).add(r.get_key_array(self.filters)[0])
+        order_ranks = r.get_order_ranks(r.get_order(self.filters)) if self.filters['node_order'] else None
+        summary_key = self.filters['subtree_keys'].get_summary_key(r.get_key_id(self.filters), order_ranks, r,
+                                                                   self.filters)[0]
+        expected_key = r.get_key_array(self.filters)[0]
+        if self.filters['node_order']:
+            expected_key += r.get_order_letters(r.get_order(self.filters))
+        assert summary_key == expected_key
+        # summary keys are rendered once and reused for all occurrences
+        summary_keys.setdefault(summary_key, set()).add(id(summary_key))
+        default_postprocess_query_results(self, r, sentence)
+
+    random.seed(12)
+    config_file = os.path.join(CONFIGS_DIR, 'config_base.ini')
+    settings = read_settings(config_file, parse_args(['--greedy_counter', greedy_counter, '--fixed', fixed]))
+    settings['output'] = None
+    filters = read_filters(settings)
+    default_postprocess_query_results = counters.Counter.postprocess_query_results
+    counters.Counter.postprocess_query_results = recording_postprocess_query_results
+    try:
+        summary = count_subtrees(settings, filters)
+    finally:
+        counters.Counter.postprocess_query_results = default_postprocess_query_results
+
+    assert key_ids and all(len(keys) == 1 for keys in key_ids.values())
+    assert len({next(iter(keys)) for keys in key_ids.values()}) == len(key_ids)
+    assert len(filters['subtree_keys']) >= len(key_ids)
+    assert all(len(ids) == 1 for ids in summary_keys.values())
+    # results are stored by rendered keys, so they may be merged with results of other processes
+    assert all(isinstance(key, str) for key in summary.representation_trees)
+    assert len(pickle.loads(pickle.dumps(filters))['subtree_keys']) == 0
+
+
+def test_feats_filters():
+    """
+    Test that feats of query trees and root whitelist are checked on shared feature bundles, also when negated.
+    :return:
+    """
+    feats = FeatureBundle((('Case', 'Nom'), ('Number', 'Sing')))
+    assert Filter._check_query_tree_feats({'feats_detailed': {'Case': (False, 'Nom')}}, feats)
+    assert not Filter._check_query_tree_feats({'feats_detailed': {'Case': (True, 'Nom')}}, feats)
+    assert not Filter._check_query_tree_feats({'feats_detailed': {'Case': (False, 'Gen')}}, feats)
+    assert Filter._check_query_tree_feats({'feats_detailed': {'Case': (True, 'Gen')}}, feats)
+    assert not Filter._check_query_tree_feats({'feats_detailed': {'Gender': (False, 'Masc')}}, feats)
+    assert Filter._check_query_tree_feats({'feats_detailed': {'Gender': (True, 'Masc')}}, feats)
+
+    filters = {'root_whitelist': [{'Case': (False, 'Gen')}, {'upos': (False, 'NOUN'), 'Number': (True, 'Plur')}]}
+    assert Filter.check_root_whitelist('pes', 'pes', 'NOUN', feats, 'nsubj', filters)
+    assert not Filter.check_root_whitelist('pes', 'pes', 'VERB', feats, 'nsubj', filters)
+    filters = {'root_whitelist': [{'Number': (True, 'Sing')}, {'Gender': (False, 'Masc')}]}
+    assert not Filter.check_root_whitelist('pes', 'pes', 'NOUN', feats, 'nsubj', filters)